@@ -0,0 +1,313 @@
+"""
+Benchmarks for vEBTree alongside a builtin set and a bisected sorted list.
+
+Run them via ``nox -s perf``, or directly with ``python benchmarks/bench.py``.
+Any pyperf option works, so e.g. ``-o before.json`` followed later by
+``pyperf compare_to before.json after.json`` shows regressions.
+
+Use ``--select`` to run a subset of benchmarks by substring of their name
+(which is ``structure-operation-distribution-universe``), and ``--memory``
+to report the memory each structure retains (and peaks at while being
+built) instead of timing.
+"""
+
+from bisect import bisect_left, bisect_right
+from time import perf_counter
+import random
+import tracemalloc
+
+import pyperf
+
+from veb import vEBTree
+
+#: how many elements each structure holds
+SIZE = 10_000
+#: the universe sizes (in bits) to benchmark across
+UNIVERSES = [16, 32, 64]
+
+
+class SortedList:
+    """
+    A sorted list maintained with bisect -- the obvious pure-Python baseline.
+    """
+
+    def __init__(self):
+        self._items = []
+
+    def __contains__(self, x):
+        i = bisect_left(self._items, x)
+        return i != len(self._items) and self._items[i] == x
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def add(self, x):
+        i = bisect_left(self._items, x)
+        if i == len(self._items) or self._items[i] != x:
+            self._items.insert(i, x)
+
+    def discard(self, x):
+        i = bisect_left(self._items, x)
+        if i != len(self._items) and self._items[i] == x:
+            del self._items[i]
+
+    def update(self, iterable):
+        self._items = sorted(set(self._items).union(iterable))
+
+    def successor(self, x):
+        i = bisect_right(self._items, x)
+        if i != len(self._items):
+            return self._items[i]
+
+    def predecessor(self, x):
+        i = bisect_left(self._items, x)
+        if i:
+            return self._items[i - 1]
+
+
+#: structure name -> (factory, whether it supports successor / predecessor)
+STRUCTURES = {
+    "vebtree": (vEBTree, True),
+    "set": (set, False),
+    "sortedlist": (SortedList, True),
+}
+
+
+def dense(bits, rng):
+    """
+    Half of a contiguous run from 0, so most clusters are full.
+    """
+    return rng.sample(range(min(2 * SIZE, 1 << bits)), SIZE)
+
+
+def sparse(bits, rng):
+    """
+    Uniformly random keys across the whole universe.
+    """
+    elements = set()
+    while len(elements) < SIZE:
+        elements.add(rng.randrange(1 << bits))
+    elements = list(elements)
+    rng.shuffle(elements)
+    return elements
+
+
+def clustered(bits, rng):
+    """
+    A handful of tight bursts at random spots in the universe.
+    """
+    width = 1 << bits
+    burst = SIZE // 16
+    elements = set()
+    while len(elements) < SIZE:
+        start = rng.randrange(width - burst)
+        elements.update(range(start, start + burst))
+    elements = list(elements)[:SIZE]
+    rng.shuffle(elements)
+    return elements
+
+
+def monotonic(bits, rng):
+    """
+    Increasing keys with random gaps, i.e. timestamps or sequence numbers.
+    """
+    gap = max(((1 << bits) // SIZE) - 1, 1)
+    elements, current = [], 0
+    for _ in range(SIZE):
+        current += rng.randint(1, gap)
+        elements.append(current)
+    return elements
+
+
+DISTRIBUTIONS = {
+    "dense": dense,
+    "sparse": sparse,
+    "clustered": clustered,
+    "monotonic": monotonic,
+}
+
+
+def filled(factory, elements):
+    structure = factory()
+    structure.update(elements)
+    return structure
+
+
+def time_add(loops, factory, elements, queries):
+    elapsed = 0
+    for _ in range(loops):
+        structure = factory()
+        add = structure.add
+        start = perf_counter()
+        for x in elements:
+            add(x)
+        elapsed += perf_counter() - start
+    return elapsed
+
+
+def time_discard(loops, factory, elements, queries):
+    elapsed = 0
+    for _ in range(loops):
+        structure = filled(factory, elements)
+        discard = structure.discard
+        start = perf_counter()
+        for x in elements:
+            discard(x)
+        elapsed += perf_counter() - start
+    return elapsed
+
+
+def time_update(loops, factory, elements, queries):
+    elapsed = 0
+    for _ in range(loops):
+        structure = factory()
+        start = perf_counter()
+        structure.update(elements)
+        elapsed += perf_counter() - start
+    return elapsed
+
+
+def time_contains(loops, factory, elements, queries):
+    structure = filled(factory, elements)
+    start = perf_counter()
+    for _ in range(loops):
+        for x in queries:
+            x in structure  # noqa: B015
+    return perf_counter() - start
+
+
+def time_successor(loops, factory, elements, queries):
+    successor = filled(factory, elements).successor
+    start = perf_counter()
+    for _ in range(loops):
+        for x in queries:
+            successor(x)
+    return perf_counter() - start
+
+
+def time_predecessor(loops, factory, elements, queries):
+    predecessor = filled(factory, elements).predecessor
+    start = perf_counter()
+    for _ in range(loops):
+        for x in queries:
+            predecessor(x)
+    return perf_counter() - start
+
+
+def time_iteration(loops, factory, elements, queries):
+    structure = filled(factory, elements)
+    start = perf_counter()
+    for _ in range(loops):
+        for _ in structure:
+            pass
+    return perf_counter() - start
+
+
+def time_grow(loops, factory, elements, queries):
+    elapsed = 0
+    for _ in range(loops):
+        structure = filled(factory, elements)
+        to_size = structure.universe_size << 8
+        start = perf_counter()
+        structure.grow(to_size)
+        elapsed += perf_counter() - start
+    return elapsed
+
+
+#: operations timed once per call rather than once per element
+BULK = {"update", "grow"}
+#: operation name -> (timer, whether it needs successor / predecessor)
+OPERATIONS = {
+    "add": (time_add, False),
+    "discard": (time_discard, False),
+    "update": (time_update, False),
+    "contains": (time_contains, False),
+    "successor": (time_successor, True),
+    "predecessor": (time_predecessor, True),
+    "iteration": (time_iteration, False),
+    "grow": (time_grow, None),
+}
+
+
+def workloads():
+    """
+    Yield each (name, elements, queries) combination to benchmark.
+    """
+    for distribution, generate in DISTRIBUTIONS.items():
+        for bits in UNIVERSES:
+            rng = random.Random(f"{distribution}-{bits}")
+            elements = generate(bits, rng)
+            top = max(elements) + 1
+            queries = [
+                rng.choice(elements) if i % 2 else rng.randrange(top)
+                for i in range(SIZE)
+            ]
+            name = f"{distribution}-2^{bits}"
+            yield name, elements, queries
+
+
+def memory(factory, elements):
+    """
+    Measure the memory retained by, and peak memory used in, a build.
+    """
+    tracemalloc.start()
+    try:
+        structure = filled(factory, elements)  # noqa: F841
+        return tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+
+def add_cmdline_args(cmd, args):
+    """
+    Forward our own arguments to pyperf's worker processes.
+    """
+    cmd.extend(["--select", args.select])
+
+
+def main():
+    runner = pyperf.Runner(add_cmdline_args=add_cmdline_args)
+    runner.argparser.add_argument(
+        "--select",
+        default="",
+        help="only run benchmarks whose name contains this substring",
+    )
+    runner.argparser.add_argument(
+        "--memory",
+        action="store_true",
+        help="report the memory used to build each structure and exit",
+    )
+    args = runner.parse_args()
+
+    for workload, elements, queries in workloads():
+        for structure, (factory, ordered) in STRUCTURES.items():
+            if args.memory:
+                name = f"{structure}-{workload}"
+                if args.select in name:
+                    retained, peak = memory(factory, elements)
+                    print(
+                        f"{name}: {retained / 1024:.1f} KiB retained, "
+                        f"{peak / 1024:.1f} KiB peak",
+                    )
+                continue
+
+            for operation, (timer, needs_order) in OPERATIONS.items():
+                if needs_order is None and factory is not vEBTree:
+                    continue  # only vEBTrees have a universe to grow
+                if needs_order and not ordered:
+                    continue
+                name = f"{structure}-{operation}-{workload}"
+                if args.select not in name:
+                    continue
+                runner.bench_time_func(
+                    name,
+                    timer,
+                    factory,
+                    elements,
+                    queries,
+                    inner_loops=None if operation in BULK else SIZE,
+                )
+
+
+if __name__ == "__main__":
+    main()
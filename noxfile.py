@@ -30,7 +30,7 @@ def tests(session):
     """
     Run the test suite with a corresponding Python version.
     """
-    session.install("virtue", ROOT)
+    session.install("virtue", f"{ROOT}[numpy]")
 
     if session.posargs and session.posargs[0] == "coverage":
         if len(session.posargs) > 1 and session.posargs[1] == "github":
@@ -75,3 +75,12 @@ def style(session):
     """
     session.install("ruff")
     session.run("ruff", "check", ROOT, __file__)
+
+
+@session(default=False)
+def perf(session):
+    """
+    Run the benchmark suite, passing any arguments along to pyperf.
+    """
+    session.install("pyperf", ROOT)
+    session.run("python", ROOT / "benchmarks" / "bench.py", *session.posargs)
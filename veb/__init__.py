@@ -1,6 +1,20 @@
 """
 Dynamically-allocated reduced-space van Emde Boas trees.
 """
-from veb._core import vEBTree
+from veb._core import (
+    ConcurrentvEBTree,
+    frozenvEBTree,
+    vEBCursor,
+    vEBDict,
+    vEBMultiset,
+    vEBTree,
+)
 
-__all__ = ["vEBTree"]
+__all__ = [
+    "ConcurrentvEBTree",
+    "frozenvEBTree",
+    "vEBCursor",
+    "vEBDict",
+    "vEBMultiset",
+    "vEBTree",
+]
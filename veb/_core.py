@@ -3,19 +3,63 @@ Dynamically allocated van Emde Boas Trees (Queues).
 
 """
 
-from collections.abc import MutableSet
-from math import ceil, floor, log2
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from collections.abc import (
+    Collection,
+    ItemsView,
+    MutableMapping,
+    MutableSet,
+    Set,
+    ValuesView,
+)
+from importlib import import_module
+from itertools import islice
+import sys
+import threading
+
+#: The default number of bits held by a single bitmask leaf.
+WORD_SIZE = 64
+
+#: How many elements `vEBTree.update` consumes from its iterable at a time.
+_UPDATE_CHUNK = 1 << 16
+
+#: Nodes with more clusters than this keep them in a dict rather than a list.
+_MAX_DENSE_CLUSTERS = 1 << 6
+
+#: How many clusters one dict of a sparse node holds before being split, and
+#: how many of the clusters' lowest bits each level of splitting uses.
+_MAX_BUCKET = 1 << 6
+_BRANCH_BITS = 4
+
+#: Trees with at most this many elements keep them in a sorted list rather
+#: than in clusters (unless their universe fits in a single leaf anyway).
+_MAX_SORTED = 64
+
+#: The header of the serialized format (see `vEBTree.to_bytes`), followed
+#: by a version (where version 1 predates trees having a base or flags).
+_MAGIC = b"vEB"
+_VERSION = 2
+_DELTAS, _BITMAP = 0, 1
+_AUTO_SHRINK, _AUTO_REBASE = 1, 2
+
+#: What `vEBDict` nodes return for keys they don't hold.
+_MISSING = object()
 
 
 class _EmptyVEBTree:
-    min = max = None
-    universe_size = 0
+    min = max = _owner = None
+    size = universe_size = 0
 
     def __contains__(self, i):
         return False
 
     def __iter__(self):
-        return iter([])
+        return iter(())
+
+    def __reversed__(self):
+        return iter(())
 
     def __len__(self):
         return 0
@@ -26,8 +70,8 @@ class _EmptyVEBTree:
     def successor(self, i):
         return None
 
-    def discard(self, i):
-        return None
+    def discard(self, i, owner=None):
+        return False
 
 
 _EMPTY = _EmptyVEBTree()
@@ -39,8 +83,46 @@ class vEBTree(MutableSet):
     discard = _root.discard
     predecessor = _root.predecessor
     successor = _root.successor
-
-    def __init__(self, contents=()):
+    word_size = WORD_SIZE
+    auto_shrink = False
+    #: The smallest element the tree's universe covers.
+    base = 0
+    auto_rebase = False
+    #: Which of the tree's nodes it may modify in place (see `snapshot`).
+    _owner = None
+    #: How many times its nodes have been modified in place, and whether
+    #: anything (i.e. a `vEBCursor`) needs that counted for every discard.
+    _changes = 0
+    _watched = False
+
+    def __init__(
+        self,
+        contents=(),
+        word_size=WORD_SIZE,
+        auto_shrink=False,
+        base=0,
+        auto_rebase=False,
+    ):
+        """
+        A new tree, whose universe starts at ``base``.
+
+        Its elements are stored relative to the base, so a tree of elements
+        in a narrow band far from zero (or below it) can be as small as one
+        near zero. With ``auto_rebase``, the base moves down to fit smaller
+        elements as they're added, and (see `vEBTree.shrink`) back up again
+        as the smallest ones are discarded. Otherwise, adding an element
+        less than the base is an error.
+        """
+        _check_word_size(word_size)
+        self.word_size = word_size
+        if auto_shrink:
+            self.auto_shrink = True
+            self.discard = self._discard
+        if auto_rebase:
+            self.auto_rebase = True
+        if base:
+            self.base = base
+            self._update_root(self._root)
         if contents:
             self.update(contents)
 
@@ -50,22 +132,104 @@ class vEBTree(MutableSet):
     __nonzero__ = __bool__
 
     def __contains__(self, i):
-        return i in self._root
+        return i - self.base in self._root
 
     def __eq__(self, other):
         if not isinstance(other, self.__class__):
             return NotImplemented
 
-        return (
+        if (
+            len(self) != len(other)
+            or self.min != other.min
+            or self.max != other.max
+        ):
+            return False
+        elif (
             self.universe_size == other.universe_size
-            and self.min == other.min
-            and self.max == other.max
-            and len(self) == len(other)
-            and all(i == j for i, j in zip(self, other))
+            and self.base == other.base
+            and self.word_size == other.word_size
+        ):
+            return _equal(self._root, other._root)
+        return all(i == j for i, j in zip(self, other))
+
+    def _from_iterable(self, iterable):
+        """
+        A tree like this one (as the `Set` operators make for other sets).
+        """
+        return self.__class__(
+            iterable,
+            word_size=self.word_size,
+            base=self.base,
+            auto_rebase=self.auto_rebase,
+        )
+
+    def __le__(self, other):
+        if not isinstance(other, vEBTree):
+            return super().__le__(other)
+        return self.issubset(other)
+
+    def __ge__(self, other):
+        if not isinstance(other, vEBTree):
+            return super().__ge__(other)
+        return other.issubset(self)
+
+    def __or__(self, other):
+        if not isinstance(other, vEBTree):
+            return super().__or__(other)
+        return self._combine(other, _union)
+
+    __ror__ = __or__
+
+    def __and__(self, other):
+        if not isinstance(other, vEBTree):
+            return super().__and__(other)
+        return self._combine(other, _intersection)
+
+    __rand__ = __and__
+
+    def __sub__(self, other):
+        if not isinstance(other, vEBTree):
+            return super().__sub__(other)
+        return self._combine(other, _difference)
+
+    def __xor__(self, other):
+        if not isinstance(other, vEBTree):
+            return super().__xor__(other)
+        return self._combine(other, _symmetric_difference)
+
+    __rxor__ = __xor__
+
+    def __ior__(self, other):
+        if not isinstance(other, vEBTree):
+            return super().__ior__(other)
+        self._combine_in_place(other, _union, _union_into)
+        return self
+
+    def __iand__(self, other):
+        if not isinstance(other, vEBTree):
+            return super().__iand__(other)
+        self._combine_in_place(other, _intersection, _intersection_into)
+        return self
+
+    def __isub__(self, other):
+        if not isinstance(other, vEBTree):
+            return super().__isub__(other)
+        self._combine_in_place(other, _difference, _difference_into)
+        return self
+
+    def __ixor__(self, other):
+        if not isinstance(other, vEBTree):
+            return super().__ixor__(other)
+        self._combine_in_place(
+            other, _symmetric_difference, _symmetric_difference_into,
         )
+        return self
 
     def __iter__(self):
-        return iter(self._root)
+        return self._shifted(iter(self._root))
+
+    def __reversed__(self):
+        return self._shifted(reversed(self._root))
 
     def __len__(self):
         return len(self._root)
@@ -73,218 +237,3552 @@ class vEBTree(MutableSet):
     def __repr__(self):
         return f"vEBTree({list(self)!r})"
 
+    def __sizeof__(self):
+        return super().__sizeof__() + self.stats()["bytes"]
+
+    def __reduce__(self):
+        return self.__class__.from_bytes, (self.to_bytes(),)
+
+    def snapshot(self):
+        """
+        A copy of this tree, made in constant time.
+
+        The two trees share all of their nodes at first. Whichever is then
+        modified copies just the nodes along the path it modifies, so the
+        cost of a snapshot is in proportion to what changes afterwards.
+        """
+        tree = self.__class__(
+            word_size=self.word_size,
+            auto_shrink=self.auto_shrink,
+            base=self.base,
+            auto_rebase=self.auto_rebase,
+        )
+        # nodes belonging to neither token are shared, and so read-only (and
+        # a tree which already modifies none of them is left untouched, so
+        # that readers can snapshot a published tree from several threads)
+        self._share()
+        tree._owner = object()
+        tree._update_root(self._root)
+        return tree
+
+    copy = __copy__ = snapshot
+
+    def _combine(self, other, combine, base=None):
+        """
+        A new tree made by merging this tree's nodes with another's.
+
+        Elements of either tree below ``base`` (if given) are left out. The
+        new tree shares whichever clusters it can with the two trees, just
+        as a snapshot would.
+        """
+        base, n = _frame(self, other, base)
+        tree = self.__class__(
+            word_size=self.word_size, base=base, auto_rebase=self.auto_rebase,
+        )
+        if n:
+            self._share()
+            other._share()
+            tree._owner = object()
+            tree._update_root(
+                _root_for(
+                    combine(
+                        _resized(self, n, self.word_size, base),
+                        _resized(other, n, self.word_size, base),
+                        tree._owner,
+                    ),
+                ),
+            )
+        return tree
+
+    def _combine_in_place(self, other, combine, combine_into):
+        """
+        Merge another tree's nodes into this tree's own.
+
+        Clusters which only this tree has are left alone, so the cost is in
+        proportion to the other tree rather than to this one.
+        """
+        if other is self:
+            other = self.snapshot()
+        if other and combine in (_union, _symmetric_difference):
+            self._make_room(other.min, other.max)
+        root = self._root
+        if not root.universe_size:
+            return
+        elif root.__class__ is _SortedNode:
+            # there's little enough here to simply build the result anew
+            combined = self._combine(
+                other, combine, None if self.auto_rebase else self.base,
+            )
+            self.base, self._owner = combined.base, combined._owner
+            self._changes += 1
+            return self._update_root(combined._root)
+
+        n, base = root.universe_size, self.base
+        theirs = _resized(other, n, self.word_size, base)
+        self._changes += 1
+        root = combine_into(self._writable_root(), theirs, self._owner)
+        self._update_root(_root_for(root))
+
+    def _share(self):
+        """
+        Stop modifying this tree's nodes in place, so they can be shared.
+
+        A tree which already modifies none of them (as is the case for a
+        snapshot, until it's next modified) is left untouched.
+        """
+        if self._root._owner is self._owner:
+            self._owner = object()
+            self._update_root(self._root)
+
     def _update_root(self, new_root):
         self._root = new_root
         self.universe_size = new_root.universe_size
-        self.discard = new_root.discard
+        if self.base:
+            self.discard = self._discard
+            self.predecessor = self._predecessor
+            self.successor = self._successor
+            return
+        if self.auto_shrink or self._owner is not None or self._watched:
+            self.discard = self._discard
+        elif new_root.__class__ is _vEBTree:
+            self.discard = self._discard_and_demote
+        else:
+            self.discard = new_root.discard
         self.predecessor = new_root.predecessor
         self.successor = new_root.successor
 
+    def _predecessor(self, i):
+        found = self._root.predecessor(i - self.base)
+        return None if found is None else self.base + found
+
+    def _successor(self, i):
+        found = self._root.successor(i - self.base)
+        return None if found is None else self.base + found
+
+    def _shifted(self, elements):
+        """
+        The given (relative) elements, shifted back up by the base.
+        """
+        if not self.base:
+            return elements
+        return map(self.base.__add__, elements)
+
+    def _check_base(self, i):
+        if i is not None and i < self.base:
+            if not self.base:
+                raise ValueError(f"{i!r} is negative")  # noqa: TRY003
+            raise ValueError(  # noqa: TRY003
+                f"{i!r} is less than the base of {self.base!r}",
+            )
+
     @classmethod
-    def of_size(cls, n):
-        tree = cls()
+    def of_size(cls, n, word_size=WORD_SIZE):
+        tree = cls(word_size=word_size)
         tree.grow(n)
         return tree
 
+    @classmethod
+    def from_sorted(cls, iterable, word_size=WORD_SIZE, base=0):
+        """
+        Build a tree from elements given in ascending order.
+
+        Each cluster is built once, bottom-up, rather than by adding the
+        elements one at a time. Repeated elements are ignored.
+        """
+        elements = []
+        for x in iterable:
+            if elements and x <= elements[-1]:
+                if x == elements[-1]:
+                    continue
+                raise ValueError(f"{x!r} is out of order")  # noqa: TRY003
+            elements.append(x)
+
+        return cls._from_elements(elements, word_size, base)
+
+    @classmethod
+    def _from_elements(cls, elements, word_size, base):
+        tree = cls(word_size=word_size, base=base)
+        if elements:
+            tree._check_base(elements[0])
+            if base:
+                elements = [x - base for x in elements]
+            tree._update_root(
+                _root_from_sorted(
+                    _universe_for(elements[-1] + 1), word_size, elements,
+                ),
+            )
+        return tree
+
     @property
     def min(self):
-        return self._root.min
+        found = self._root.min
+        return None if found is None else self.base + found
 
     @property
     def max(self):
-        return self._root.max
+        found = self._root.max
+        return None if found is None else self.base + found
+
+    @classmethod
+    def from_array(cls, array, word_size=WORD_SIZE, base=0):
+        """
+        Build a tree from a NumPy array (or array-like) of integers.
+        """
+        np = _numpy()
+        elements = np.unique(np.asarray(array)).tolist()
+        return cls._from_elements(elements, word_size, base)
+
+    def to_array(self, dtype=None):
+        """
+        The elements of this tree, in ascending order, as a NumPy array.
+        """
+        np = _numpy()
+        if dtype is None:
+            dtype = _dtype_for(np, self.min, self.max)
+        return np.fromiter(self, dtype=dtype, count=len(self))
+
+    def contains_many(self, queries):
+        """
+        Check membership for a whole array of queries at once.
+
+        Returns a boolean NumPy array matching the shape of ``queries``.
+        """
+        np = _numpy()
+        queries = np.asarray(queries)
+        unique, inverse = np.unique(queries, return_inverse=True)
+        base = self.base
+        unique = [x - base for x in unique.tolist()]
+        start = bisect_left(unique, 0)
+        stop = bisect_left(unique, self.universe_size)
+        found = [False] * len(unique)
+        if start < stop:
+            found[start:stop] = self._root.contains_many(unique[start:stop])
+        # (before NumPy 2, the inverse is always flat)
+        return np.array(found, dtype=bool)[inverse].reshape(queries.shape)
+
+    def successor_many(self, queries, default=-1, dtype=None):
+        """
+        Find the successor of each of a whole array of queries at once.
+
+        Queries with no successor get ``default`` in the returned array.
+        """
+        return self._many(queries, "successor_many", default, dtype)
+
+    def predecessor_many(self, queries, default=-1, dtype=None):
+        """
+        Find the predecessor of each of a whole array of queries at once.
+
+        Queries with no predecessor get ``default`` in the returned array.
+        """
+        return self._many(queries, "predecessor_many", default, dtype)
+
+    def _many(self, queries, method, default, dtype):
+        np = _numpy()
+        if dtype is None:
+            lo, hi = self.min, self.max
+            if lo is None:
+                lo = hi = default
+            elif isinstance(default, int):
+                lo, hi = min(lo, default), max(hi, default)
+            dtype = _dtype_for(np, lo, hi)
+        queries = np.asarray(queries)
+        unique, inverse = np.unique(queries, return_inverse=True)
+        base = self.base
+        if self:
+            # sorted, so that each cluster is resolved once for the batch
+            found = getattr(self._root, method)(
+                [x - base for x in unique.tolist()],
+            )
+        else:
+            found = [None] * len(unique)
+        results = np.array(
+            [default if each is None else base + each for each in found],
+            dtype=dtype,
+        )
+        return results[inverse].reshape(queries.shape)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Load a tree previously serialized with `vEBTree.to_bytes`.
+        """
+        data = memoryview(data)
+        i = len(_MAGIC)
+        version = data[i] if len(data) > i else 0
+        if data[:i] != _MAGIC or not 1 <= version <= _VERSION:
+            raise ValueError("not a serialized vEBTree")  # noqa: TRY003
+        i += 1
+        word_size, i = _read_varint(data, i)
+        base = flags = 0
+        if version > 1:
+            base, i = _read_varint(data, i)
+            base = (base >> 1) ^ -(base & 1)
+            flags, i = _read_varint(data, i)
+        universe_size, i = _read_varint(data, i)
+        count, i = _read_varint(data, i)
+        if i >= len(data):
+            raise ValueError("truncated serialized vEBTree")  # noqa: TRY003
+        encoding, body = data[i], data[i + 1:]
+
+        # a universe is always a power of 2 (and only empty when the tree is)
+        valid = universe_size != 1 and not universe_size & (universe_size - 1)
+        valid = valid and not flags & ~(_AUTO_SHRINK | _AUTO_REBASE)
+        elements = []
+        if encoding == _DELTAS:
+            x, i = -1, 0
+            for _ in range(count):
+                delta, i = _read_varint(body, i)
+                x += delta
+                valid = valid and delta
+                elements.append(x)
+            valid = valid and i == len(body)
+        elif encoding == _BITMAP:
+            for i, byte in enumerate(body):
+                offset = i << 3
+                elements.extend(offset | bit for bit in _ascending(byte))
+            valid = valid and len(body) == (universe_size + 7) >> 3
+        else:
+            raise ValueError(  # noqa: TRY003
+                f"unknown vEBTree encoding {encoding!r}",
+            )
+        if (
+            not valid
+            or len(elements) != count
+            or elements[-1:] >= [universe_size]
+        ):
+            raise ValueError("corrupt serialized vEBTree")  # noqa: TRY003
+
+        tree = cls(
+            word_size=word_size,
+            auto_shrink=bool(flags & _AUTO_SHRINK),
+            base=base,
+            auto_rebase=bool(flags & _AUTO_REBASE),
+        )
+        if universe_size:
+            tree._update_root(
+                _root_from_sorted(universe_size, word_size, elements),
+            )
+        return tree
+
+    def to_bytes(self):
+        """
+        Serialize this tree into a compact binary form.
+
+        The elements are stored either as a packed bitmap of the universe or
+        as variable-length deltas between successive elements, whichever is
+        smaller, after the tree's word size, base, universe size and flags.
+        `vEBTree.from_bytes` loads the result.
+        """
+        data = bytearray(_MAGIC)
+        data.append(_VERSION)
+        _write_varint(data, self.word_size)
+        # zigzag encoded, so that a negative base is still small
+        _write_varint(data, (self.base << 1) ^ -(self.base < 0))
+        _write_varint(
+            data,
+            _AUTO_SHRINK * self.auto_shrink | _AUTO_REBASE * self.auto_rebase,
+        )
+        _write_varint(data, self.universe_size)
+        _write_varint(data, len(self))
+
+        deltas, previous = bytearray(), -1
+        for x in self._root:
+            _write_varint(deltas, x - previous)
+            previous = x
+
+        bitmap_size = (self.universe_size + 7) >> 3
+        if len(deltas) <= bitmap_size:
+            data.append(_DELTAS)
+            data += deltas
+        else:
+            bitmap = bytearray(bitmap_size)
+            for x in self._root:
+                bitmap[x >> 3] |= 1 << (x & 7)
+            data.append(_BITMAP)
+            data += bitmap
+        return bytes(data)
+
+    def issubset(self, other):
+        """
+        Whether every element of this tree is also in ``other``.
+        """
+        if not isinstance(other, vEBTree):
+            other = self.__class__(
+                other, word_size=self.word_size, auto_rebase=True,
+            )
+        if len(self) > len(other):
+            return False
+        elif not self:
+            return True
+        elif self.min < other.min or self.max > other.max:
+            return False
+        base, n = _frame(self, other)
+        return _is_subset(
+            _resized(self, n, self.word_size, base),
+            _resized(other, n, self.word_size, base),
+        )
+
+    def issuperset(self, other):
+        """
+        Whether every element of ``other`` is also in this tree.
+        """
+        if not isinstance(other, vEBTree):
+            other = self.__class__(
+                other, word_size=self.word_size, auto_rebase=True,
+            )
+        return other.issubset(self)
 
     def grow(self, to_size):
+        """
+        Grow the universe to fit elements less than ``to_size``.
+
+        Wherever they line up with the new layout, the old root or its
+        clusters are moved over whole, and for that the universe may grow
+        one bit beyond ``to_size`` (see `_grown_universe`).
+        """
         if to_size <= self.universe_size:
             return
-        if to_size <= 2:
-            return self._update_root(_vEBLeaf())
-
-        # u = 2 ^ m -> m = log2(u), u = to_size, m = square_root
-        square_root = ceil(log2(to_size))
-        old_root = self._root
-        old_size = self.universe_size
-        new_size = 1 << square_root
-        # 1 << m = 2 ^ m
-        self._update_root(_vEBTree(new_size))
-
-        if old_root is not _EMPTY:
-            # when tree grows from even powers of 2 into odd ones, for example
-            # 4 into 8 (2^2 into 2^3), sizes of clusters stay the same, which
-            # allows to copy them directly from old root.
-            if new_size - old_size == 1 and old_size % 2 == 0:
-                for i in range(len(old_root.clusters)):
-                    self._root.clusters[i] = old_root.clusters[i]
-                # updating clusters means updating summary
-                # NOTE: this worked first time even though I didn't really
-                # know how exactly summary works. be cautious here.
-                for i in range(len(old_root.summary)):
-                    self._root.summary[i] = old_root.summary[i]
-                # min and max properties need to be updated
-                self._root.min = old_root.min
-                self._root.max = old_root.max
+        root = self._root
+        if not self:
+            return self._update_root(
+                _root_from_sorted(_universe_for(to_size), self.word_size, []),
+            )
+        elif root.__class__ is _SortedNode:
+            return self._update_root(
+                _SortedNode(_universe_for(to_size), root),
+            )
+        self._update_root(
+            _rebuild(
+                _grown_universe(root, to_size),
+                self.word_size,
+                [(0, root)],
+                owner=self._owner,
+            ),
+        )
+
+    def _rebase(self, lo):
+        """
+        Move the (non-empty) tree's base down to ``lo``, or a bit below it.
+
+        The old root is moved over whole into the new one, which it can only
+        be if the base moves by a multiple of the old universe size.
+        """
+        size = self.universe_size
+        offset = -((lo - self.base) // size) * size
+        self.base -= offset
+        root = self._root
+        if root.__class__ is _SortedNode:
+            elements = [offset + x for x in root]
+            return self._update_root(
+                _SortedNode(_universe_for(offset + size), elements),
+            )
+        self._update_root(
+            _rebuild(
+                _grown_universe(root, offset + size),
+                self.word_size,
+                [(offset, root)],
+                owner=self._owner,
+            ),
+        )
+
+    def _make_room(self, lo, hi):
+        """
+        Rebase and grow the tree as needed to cover ``lo`` through ``hi``.
+        """
+        if not self.auto_rebase:
+            self._check_base(lo)
+        elif not self:
+            self.base = lo
+            self._update_root(self._root)
+        elif lo < self.base:
+            self._rebase(lo)
+        if hi - self.base >= self.universe_size:
+            self.grow(hi - self.base + 1)
+
+    def irange(self, lo, hi, reverse=False):
+        """
+        Lazily iterate over the elements between ``lo`` and ``hi`` inclusive.
+        """
+        base = self.base
+        lo, hi = max(lo - base, 0), min(hi - base, self.universe_size - 1)
+        if lo > hi:
+            return iter(())
+        elif reverse:
+            return self._shifted(self._root.irange_reversed(lo, hi))
+        return self._shifted(self._root.irange(lo, hi))
+
+    def count_range(self, lo, hi):
+        """
+        Count the elements between ``lo`` and ``hi`` inclusive.
+        """
+        base = self.base
+        lo, hi = max(lo - base, 0), min(hi - base, self.universe_size - 1)
+        if lo > hi:
+            return 0
+        return self._root.count_range(lo, hi)
+
+    def discard_range(self, lo, hi):
+        """
+        Discard every element between ``lo`` and ``hi`` inclusive.
+
+        Returns how many elements were discarded.
+        """
+        base = self.base
+        lo, hi = max(lo - base, 0), min(hi - base, self.universe_size - 1)
+        if lo > hi:
+            return 0
+        self._changes += 1
+        discarded = self._writable_root().discard_range(lo, hi, self._owner)
+        if discarded:
+            self._discarded()
+        return discarded
+
+    def rank(self, x):
+        """
+        How many elements of the tree are smaller than ``x``.
+        """
+        x -= self.base
+        if x <= 0:
+            return 0
+        elif x >= self.universe_size:
+            return len(self)
+        return self._root.rank(x)
+
+    def select(self, k):
+        """
+        The ``k``-th smallest element of the tree, counting from 0.
+
+        Negative ``k`` counts from the largest element, as with indexing.
+        """
+        size = len(self)
+        if k < 0:
+            k += size
+        if not 0 <= k < size:
+            raise IndexError(  # noqa: TRY003
+                f"{k!r} is out of range for a tree of {size}",
+            )
+        return self.base + self._root.select(k)
+
+    __getitem__ = select
+
+    def stats(self):
+        """
+        Describe the shape and (estimated) memory use of this tree.
+
+        Returns a dict with:
+
+            * ``elements``: the number of elements in the tree
+            * ``universe_size``: the size of the tree's universe
+            * ``depth``: how many levels of nodes there are
+            * ``nodes``: the number of inner nodes (or small sorted roots)
+            * ``leaves``: the number of bitmask leaves
+            * ``cluster_slots``: how many cluster slots inner nodes allocate
+            * ``occupied_cluster_slots``: how many of those hold a cluster
+            * ``summary_nodes``: how many of the nodes belong to summaries
+            * ``summary_bytes``: the estimated bytes used by those nodes
+            * ``bytes``: the estimated bytes used by all nodes
+        """
+        stats = dict(
+            elements=len(self),
+            universe_size=self.universe_size,
+            depth=0,
+            nodes=0,
+            leaves=0,
+            cluster_slots=0,
+            occupied_cluster_slots=0,
+            summary_nodes=0,
+            summary_bytes=0,
+            bytes=0,
+        )
+        if self._root is not _EMPTY:
+            _collect_stats(self._root, stats)
+        return stats
+
+    def shrink(self):
+        """
+        Shrink the universe to the smallest one which fits the largest element.
+
+        Surviving clusters are moved across to the new root whole. Trees
+        which `auto_rebase` also move their base up to the start of the
+        root's cluster holding the smallest element. Trees left with few
+        enough elements go back to keeping them in a sorted list, and move
+        their base up to the smallest element itself.
+        """
+        if not self:
+            if self._root is not _EMPTY:
+                self._update_root(_EMPTY)
+            return
+
+        root = self._root
+        if root.__class__ is not _vEBLeaf and root.size <= _MAX_SORTED:
+            elements = list(root)
+            delta = elements[0] if self.auto_rebase else 0
+            to_size = _universe_for(elements[-1] - delta + 1)
+            if (
+                delta
+                or to_size < self.universe_size
+                or root.__class__ is _vEBTree
+            ):
+                self.base += delta
+                self._update_root(
+                    _root_from_sorted(
+                        to_size, self.word_size, [x - delta for x in elements],
+                    ),
+                )
+            return
+
+        pieces, loose, delta = [(0, root)], (), 0
+        if self.auto_rebase:
+            if root.__class__ is _vEBLeaf:
+                delta = root.min
+                bits = root.bits >> delta
+                pieces = [(0, _vEBLeaf(root.universe_size, bits))]
             else:
-                self.update(old_root)
+                shift = root._shift
+                delta = root.min >> shift << shift
+                if delta:
+                    pieces = [
+                        ((high << shift) - delta, root.clusters[high])
+                        for high in root.summary
+                    ]
+                    loose = [root.min - delta]
+
+        to_size = _universe_for(root.max - delta + 1)
+        if delta or to_size < self.universe_size:
+            self.base += delta
+            self._update_root(
+                _rebuild(
+                    to_size, self.word_size, pieces, loose, owner=self._owner,
+                ),
+            )
+
+    def compact(self):
+        """
+        Rebuild the whole tree, bottom-up, into the smallest fitting universe.
+
+        Unlike `vEBTree.shrink`, which reuses whatever clusters it can, this
+        also releases any space held on to by clusters emptied by discards.
+        """
+        elements = list(self._root)
+        if elements:
+            if self.auto_rebase and elements[0]:
+                self.base += elements[0]
+                elements = [x - elements[0] for x in elements]
+            self._update_root(
+                _root_from_sorted(
+                    _universe_for(elements[-1] + 1), self.word_size, elements,
+                ),
+            )
+        elif self._root is not _EMPTY:
+            self._update_root(_EMPTY)
+
+    def _maybe_shrink(self):
+        # leave some headroom so that a tree hovering around a boundary isn't
+        # repeatedly shrunk and then grown again
+        root = self._root
+        if root.min is None:
+            return self.shrink()
+        elif root.__class__ is _vEBTree and root.size <= _MAX_SORTED >> 1:
+            # (not as soon as it fits, lest a tree hovering there flip-flop)
+            root = _SortedNode(root.universe_size, root)
+            self._update_root(root)
+        span = root.max - root.min if self.auto_rebase else root.max
+        if span < self.universe_size >> 2:
+            self.shrink()
+
+    def _discard(self, i):
+        self._changes += 1
+        i -= self.base
+        root = self._root
+        if root._owner is not self._owner:
+            if i not in root:
+                return False
+            root = self._writable_root()
+        discarded = root.discard(i, self._owner)
+        if discarded:
+            self._discarded()
+        return discarded
+
+    def _discard_and_demote(self, i):
+        """
+        Discard from a clustered root which nothing else needs to hear about.
+        """
+        root = self._root
+        if not root.discard(i):
+            return False
+        elif root.size <= _MAX_SORTED >> 1:
+            self._update_root(_SortedNode(root.universe_size, root))
+        return True
+
+    def _discarded(self):
+        """
+        Shrink (if automatic) or demote the root after elements are discarded.
+        """
+        if self.auto_shrink:
+            return self._maybe_shrink()
+        root = self._root
+        if root.__class__ is _vEBTree and root.size <= _MAX_SORTED >> 1:
+            # (not as soon as it fits, lest a tree hovering there flip-flop)
+            self._update_root(_SortedNode(root.universe_size, root))
+
+    def _writable_root(self):
+        """
+        The root, first copied if it is shared with a snapshot.
+        """
+        root = self._root
+        if root._owner is not self._owner:
+            root = root._copy_for(self._owner)
+            self._update_root(root)
+        return root
 
     def add(self, i):
-        if i >= self.universe_size:
-            self.grow(i + 1)
-        self._root.add(i)
+        x = i - self.base
+        if x < 0 or x >= self.universe_size:
+            self._make_room(i, i)
+            x = i - self.base
+        self._changes += 1
+        owner, root = self._owner, self._root
+        if root._owner is not owner:
+            root = self._writable_root()
+        if root.__class__ is not _SortedNode:
+            return root.add(x, owner)
+        added = root.add(x, owner)
+        if root.size > _MAX_SORTED:
+            self._promote()
+        return added
 
     def update(self, iterable):
-        maxX = -1
-        for x in iterable:
-            maxX = max(maxX, x)
-        # this is done to prevent multiple grows per one update call
-        if maxX >= self.universe_size:
-            self.grow(maxX + 1)
-        # adding maxX twice doesn't hurt anybody, so it's not excluded
-        for i in iterable:
-            self.add(i)
+        """
+        Add every element of the given iterable, consuming it exactly once.
+
+        Elements are inserted in sorted batches, growing the tree at most once
+        per batch and visiting each cluster once per batch.
+        """
+        iterator = iter(iterable)
+        while True:
+            chunk = sorted(set(islice(iterator, _UPDATE_CHUNK)))
+            if not chunk:
+                return
+            self._make_room(chunk[0], chunk[-1])
+            base = self.base
+            if base:
+                chunk = [x - base for x in chunk]
+            self._changes += 1
+            root = self._writable_root()
+            root.update(chunk, self._owner)
+            if root.__class__ is _SortedNode and root.size > _MAX_SORTED:
+                self._promote()
+
+    def _promote(self):
+        """
+        Move a root which has outgrown its sorted list into clusters.
+        """
+        root = self._root
+        self._update_root(
+            _from_sorted(root.universe_size, self.word_size, root.elements),
+        )
+
+    push = add
+
+    def cursor(self, x):
+        """
+        A `vEBCursor` over this tree, starting at the smallest element >= x.
+        """
+        if not self._watched:
+            self._watched = True
+            self._update_root(self._root)
+        cursor = vEBCursor(self)
+        cursor.seek(x)
+        return cursor
+
+    def peek_min(self):
+        """
+        The smallest element, which must exist.
+        """
+        x = self.min
+        if x is None:
+            raise KeyError("peek at an empty tree")  # noqa: TRY003
+        return x
+
+    def peek_max(self):
+        """
+        The largest element, which must exist.
+        """
+        x = self.max
+        if x is None:
+            raise KeyError("peek at an empty tree")  # noqa: TRY003
+        return x
+
+    def pop_min(self):
+        """
+        Remove and return the smallest element.
+
+        The minimum is kept at the root, so this is a single discard which
+        descends only to pull up the next smallest element.
+        """
+        x = self.min
+        if x is None:
+            raise KeyError("pop from an empty tree")  # noqa: TRY003
+        self.discard(x)
+        return x
+
+    def pop_max(self):
+        """
+        Remove and return the largest element.
+        """
+        x = self.max
+        if x is None:
+            raise KeyError("pop from an empty tree")  # noqa: TRY003
+        self.discard(x)
+        return x
+
+    def popn_min(self, k):
+        """
+        Remove and return (in ascending order) up to ``k`` smallest elements.
+        """
+        popped = list(islice(self, k))
+        if popped:
+            self.discard_range(popped[0], popped[-1])
+        return popped
+
+
+class frozenvEBTree(Set):
+    """
+    An immutable, hashable counterpart to `vEBTree` for read-mostly use.
+
+    Its elements are kept in one flat, sorted machine-word `array`, so that
+    lookups are a binary search over contiguous memory rather than a walk
+    through a graph of node objects.
+    """
+
+    __slots__ = ("_hash", "_keys")
+
+    def __init__(self, contents=()):
+        if isinstance(contents, (vEBTree, frozenvEBTree)):
+            elements = list(contents)
+        else:
+            elements = sorted(set(contents))
+        try:
+            self._keys = array("Q", elements)
+        except OverflowError:
+            self._keys = tuple(elements)
+        self._hash = None
+
+    def __contains__(self, x):
+        keys = self._keys
+        i = bisect_left(keys, x)
+        return i != len(keys) and keys[i] == x
+
+    def __eq__(self, other):
+        if isinstance(other, frozenvEBTree):
+            return self._keys == other._keys
+        return super().__eq__(other)
+
+    def __hash__(self):
+        # equal to a frozenset's hash (which Set._hash only matches on some
+        # versions), so that the two can stand in for one another as keys
+        if self._hash is None:
+            self._hash = hash(frozenset(self._keys))
+        return self._hash
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return f"frozenvEBTree({list(self)!r})"
+
+    def __reversed__(self):
+        return reversed(self._keys)
+
+    @property
+    def min(self):
+        return self._keys[0] if self._keys else None
+
+    @property
+    def max(self):
+        return self._keys[-1] if self._keys else None
+
+    def predecessor(self, x):
+        i = bisect_left(self._keys, x)
+        return self._keys[i - 1] if i else None
+
+    def successor(self, x):
+        keys = self._keys
+        i = bisect_right(keys, x)
+        return keys[i] if i != len(keys) else None
+
+
+class vEBCursor:
+    """
+    A position within a `vEBTree`, for walking through it nearby.
+
+    The cursor remembers the path of nodes it descended through, so moving
+    to a neighbouring element starts from the lowest node containing both,
+    rather than from the root -- stepping within a leaf touches only the
+    leaf. The tree may still be modified while a cursor is in use: the
+    cursor notices, and finds again whichever part of its path has changed.
+    """
+
+    def __init__(self, tree):
+        self._tree = tree
+        self._base = tree.base
+        self._changes = tree._changes
+        self._path = [(tree._root, 0, None)]
+        self.position = tree.base
+
+    def __repr__(self):
+        return f"<vEBCursor at {self.position!r}>"
+
+    def _valid_path(self, y):
+        """
+        The path, trimmed to whichever part of it still leads towards ``y``.
+        """
+        tree, path = self._tree, self._path
+        if path[0][0] is not tree._root or self._base != tree.base:
+            self._base, self._changes = tree.base, tree._changes
+            path[:] = [(tree._root, 0, None)]
+            return path
+        if self._changes == tree._changes and y == self.position:
+            return path
+        self._changes = tree._changes
+
+        x = y - self._base
+        for depth in range(1, len(path)):
+            parent, offset, _ = path[depth - 1]
+            node, _, high = path[depth]
+            # a node's min is in none of its clusters, so x must be above it
+            local, minimum = x - offset, parent.min
+            if (
+                minimum is None
+                or not minimum < local < parent.universe_size
+                or local >> parent._shift != high
+                or parent.clusters[high] is not node
+            ):
+                del path[depth:]
+                break
+        return path
+
+    def _move_to(self, depth, x):
+        """
+        Move to the (relative) position ``x``, found at the given depth.
+        """
+        path = self._path
+        del path[depth + 1:]
+        node, offset, _ = path[-1]
+        while node.__class__ is _vEBTree:
+            local, minimum = x - offset, node.min
+            if minimum is None or not minimum < local < node.universe_size:
+                break
+            shift = node._shift
+            high = local >> shift
+            node = node.clusters[high]
+            if node is None:
+                break
+            offset += high << shift
+            path.append((node, offset, high))
+        self.position = self._base + x
+        return self.position
+
+    def peek(self):
+        """
+        The element the cursor is at, or `None` if it is not at one.
+
+        A cursor isn't at an element if it has moved past the end of the tree
+        or if its element has been discarded since it moved there.
+        """
+        node, offset, _ = self._valid_path(self.position)[-1]
+        if self.position - self._base - offset in node:
+            return self.position
+        return None
+
+    def next(self):
+        """
+        Move to and return the next element, or return `None` if none is left.
+        """
+        tree, path = self._tree, self._path
+        if (
+            self._changes != tree._changes
+            or path[0][0] is not tree._root
+            or self._base != tree.base
+        ):
+            path = self._valid_path(self.position)
+        x = self.position - self._base
+        depth = len(path) - 1
+        node, offset, _ = path[depth]
+        local = x - offset
+        if node.__class__ is _vEBLeaf and local >= 0:
+            # the common case, stepping within a leaf, which keeps the path
+            bits = node.bits >> (local + 1) << (local + 1)
+            if bits:
+                self.position += (bits & -bits).bit_length() - 1 - local
+                return self.position
+            depth -= 1
+        while depth >= 0:
+            node, offset, _ = path[depth]
+            local, maximum = x - offset, node.max
+            if maximum is not None and local < maximum:
+                return self._move_to(depth, offset + node.successor(local))
+            depth -= 1
+        return None
+
+    def prev(self):
+        """
+        Move to and return the previous element, or return `None` if none is.
+        """
+        tree, path = self._tree, self._path
+        if (
+            self._changes != tree._changes
+            or path[0][0] is not tree._root
+            or self._base != tree.base
+        ):
+            path = self._valid_path(self.position)
+        x = self.position - self._base
+        depth = len(path) - 1
+        node, offset, _ = path[depth]
+        local = x - offset
+        if node.__class__ is _vEBLeaf and 0 < local <= node.universe_size:
+            bits = node.bits & ((1 << local) - 1)
+            if bits:
+                self.position += bits.bit_length() - 1 - local
+                return self.position
+            depth -= 1
+        while depth >= 0:
+            node, offset, _ = path[depth]
+            local, minimum = x - offset, node.min
+            if minimum is not None and local > minimum:
+                local = min(local, node.universe_size)
+                return self._move_to(depth, offset + node.predecessor(local))
+            depth -= 1
+        return None
+
+    def seek(self, y):
+        """
+        Move to and return the smallest element ``>= y``, or `None` if none is.
+
+        A cursor which doesn't find one is left at ``y``.
+        """
+        depth = len(self._valid_path(y)) - 1
+        self._move_to(depth, max(y - self._base, -1))
+        self.position = y
+        found = self.peek()
+        return self.next() if found is None else found
+
+
+class vEBDict(MutableMapping):
+    """
+    A mapping from integer keys, kept in ascending order.
+
+    The keys are held in the nodes of a van Emde Boas tree, each alongside
+    its value, so ordered queries like `vEBDict.successor_item` take the
+    tree's ``O(log log u)`` time, and slicing selects a range of keys, e.g.
+    ``d[10:20]`` is a new `vEBDict` of the items whose keys are at least 10
+    and less than 20.
+
+    Keys are stored relative to a base, which (along with the universe)
+    moves to fit whichever keys are set.
+    """
+
+    def __init__(self, contents=(), word_size=WORD_SIZE):
+        _check_word_size(word_size)
+        self.word_size = word_size
+        self._root, self._base = _vEBMapLeaf(word_size), 0
+        self.update(contents)
+
+    def __contains__(self, key):
+        return self._get(key) is not _MISSING
+
+    def __getitem__(self, key):
+        if key.__class__ is slice:
+            return self._slice(key)
+        value = self._get(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        root = self._root
+        if not self._base <= key < self._base + root.universe_size:
+            root = self._fit(key)
+        root.set(key - self._base, value)
+
+    def __delitem__(self, key):
+        if self._pop(key) is _MISSING:
+            raise KeyError(key)
+
+    def __iter__(self):
+        base = self._base
+        return (base + key for key in self._root)
+
+    def __reversed__(self):
+        base = self._base
+        return (base + key for key in reversed(self._root))
+
+    def __len__(self):
+        return self._root.size
+
+    def __repr__(self):
+        return f"vEBDict({dict(self.items())!r})"
+
+    def _get(self, key):
+        if not isinstance(key, int):
+            return _MISSING
+        key -= self._base
+        root = self._root
+        if 0 <= key < root.universe_size:
+            return root.get(key, _MISSING)
+        return _MISSING
+
+    def _pop(self, key):
+        if not isinstance(key, int):
+            return _MISSING
+        key -= self._base
+        root = self._root
+        if 0 <= key < root.universe_size:
+            return root.pop(key)
+        return _MISSING
+
+    def _fit(self, key):
+        """
+        Grow the universe (and move the base) until it holds ``key``.
+
+        Each step squares the universe, which puts the old root whole into
+        one of the new root's clusters, so it costs only the lifting of its
+        minimum out into the new root.
+        """
+        root, base = self._root, self._base
+        if not root.size:
+            n = self.word_size
+            root, base = _vEBMapLeaf(n), key - key % n
+        while not base <= key < base + root.universe_size:
+            n = root.universe_size
+            # the old root is the first of the new root's clusters, or if the
+            # base needs to move down, the last
+            high = n - 1 if key < base else 0
+            base -= high * n
+            root = _wrapped(root, high, self.word_size)
+        self._root, self._base = root, base
+        return root
+
+    def _items(self, pairs):
+        base = self._base
+        return ((base + key, value) for key, value in pairs)
+
+    def _item(self, pair):
+        return None if pair is None else (self._base + pair[0], pair[1])
+
+    def _slice(self, bounds):
+        if bounds.step is not None:
+            raise ValueError("vEBDict slices cannot have a step")  # noqa: TRY003
+        sliced = self.__class__(word_size=self.word_size)
+        root, base = self._root, self._base
+        # (clamped to the universe, as nodes expect)
+        lo, hi, n = bounds.start, bounds.stop, root.universe_size
+        lo = 0 if lo is None else min(max(lo - base, 0), n)
+        hi = n if hi is None else min(max(hi - base, 0), n)
+        if lo < hi:
+            for key, value in self._items(root.irange_items(lo, hi - 1)):
+                sliced[key] = value
+        return sliced
+
+    def clear(self):
+        self._root, self._base = _vEBMapLeaf(self.word_size), 0
+
+    def get(self, key, default=None):
+        value = self._get(key)
+        return default if value is _MISSING else value
+
+    def pop(self, key, default=_MISSING):
+        value = self._pop(key)
+        if value is _MISSING:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        return value
+
+    def items(self):
+        return _vEBDictItems(self)
+
+    def values(self):
+        return _vEBDictValues(self)
+
+    def floor_key(self, key):
+        """
+        The largest key less than or equal to ``key``, or `None`.
+        """
+        found = self._root.predecessor(key + 1 - self._base)
+        return None if found is None else self._base + found
+
+    def ceiling_key(self, key):
+        """
+        The smallest key greater than or equal to ``key``, or `None`.
+        """
+        found = self._root.successor(key - 1 - self._base)
+        return None if found is None else self._base + found
+
+    def predecessor_item(self, key):
+        """
+        The item with the largest key less than ``key``, or `None`.
+        """
+        return self._item(self._root.predecessor_item(key - self._base))
+
+    def successor_item(self, key):
+        """
+        The item with the smallest key greater than ``key``, or `None`.
+        """
+        return self._item(self._root.successor_item(key - self._base))
+
+
+class _vEBDictItems(ItemsView):
+    """
+    A `vEBDict`'s items, read straight out of its nodes.
+    """
+
+    def __iter__(self):
+        return self._mapping._items(self._mapping._root.items())
+
+    def __reversed__(self):
+        return self._mapping._items(self._mapping._root.items_reversed())
+
+
+class _vEBDictValues(ValuesView):
+    """
+    A `vEBDict`'s values, read straight out of its nodes.
+    """
+
+    def __iter__(self):
+        return (value for _, value in self._mapping._root.items())
+
+    def __reversed__(self):
+        return (
+            value for _, value in self._mapping._root.items_reversed()
+        )
+
+
+class vEBMultiset(Collection):
+    """
+    A collection of integers which may each occur many times.
+
+    Each distinct element's count is kept alongside it in the nodes of a
+    `vEBDict`, so that `vEBMultiset.successor` and `vEBMultiset.predecessor`
+    skip straight over repeated elements, and its length is the total
+    number of elements counting repeats.
+    """
+
+    def __init__(self, contents=(), word_size=WORD_SIZE):
+        self._counts = vEBDict(word_size=word_size)
+        self._size = 0
+        for x in contents:
+            self.add(x)
+
+    def __contains__(self, x):
+        return x in self._counts
+
+    def __eq__(self, other):
+        if not isinstance(other, vEBMultiset):
+            return NotImplemented
+        return self._counts == other._counts
+
+    def __iter__(self):
+        for x, count in self._counts.items():
+            for _ in range(count):
+                yield x
+
+    def __reversed__(self):
+        for x, count in reversed(self._counts.items()):
+            for _ in range(count):
+                yield x
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        return f"vEBMultiset({list(self)!r})"
+
+    @property
+    def min(self):
+        return next(iter(self._counts), None)
+
+    @property
+    def max(self):
+        return next(reversed(self._counts), None)
+
+    @property
+    def word_size(self):
+        return self._counts.word_size
+
+    def count(self, x):
+        """
+        How many times ``x`` occurs.
+        """
+        return self._counts.get(x, 0)
+
+    def items(self):
+        """
+        The distinct elements paired with their counts, in ascending order.
+        """
+        return iter(self._counts.items())
+
+    def add(self, x, n=1):
+        """
+        Add ``n`` more occurrences of ``x``, returning how many there now are.
+        """
+        if n < 1:
+            raise ValueError(f"can't add {n!r} occurrences")  # noqa: TRY003
+        counts = self._counts
+        counts[x] = count = counts.get(x, 0) + n
+        self._size += n
+        return count
+
+    def remove_one(self, x):
+        """
+        Remove a single occurrence of ``x``, returning how many remain.
+        """
+        counts = self._counts
+        count = counts.pop(x, 0) - 1
+        if count < 0:
+            raise KeyError(x)
+        elif count:
+            counts[x] = count
+        self._size -= 1
+        return count
+
+    def predecessor(self, x):
+        """
+        The largest element less than ``x``, or `None`.
+        """
+        item = self._counts.predecessor_item(x)
+        return None if item is None else item[0]
+
+    def successor(self, x):
+        """
+        The smallest element greater than ``x``, or `None`.
+        """
+        item = self._counts.successor_item(x)
+        return None if item is None else item[0]
+
+
+def _reader(name):
+    """
+    A method which queries the last published tree (see `ConcurrentvEBTree`).
+    """
+    def read(self, *args, **kwargs):
+        return getattr(self._published, name)(*args, **kwargs)
+
+    read.__name__, read.__doc__ = name, getattr(vEBTree, name).__doc__
+    return read
+
+
+def _writer(name):
+    """
+    A method which modifies and then republishes a `ConcurrentvEBTree`.
+    """
+    def write(self, *args, **kwargs):
+        with self._lock:
+            result = getattr(self._tree, name)(*args, **kwargs)
+            self._publish()
+        return result
+
+    write.__name__, write.__doc__ = name, getattr(vEBTree, name).__doc__
+    return write
+
+
+class ConcurrentvEBTree(MutableSet):
+    """
+    A `vEBTree` which can be shared between threads.
+
+    Writers take turns modifying a private tree under a lock, and then
+    publish a `vEBTree.snapshot` of it by assigning a single attribute.
+    Readers never lock. They query whichever snapshot was last published,
+    which never changes underneath them, so queries proceed in parallel
+    with writes and never see a half-finished one (such as a root which
+    `vEBTree.grow` is midway through swapping).
+
+    Each read may see a newer snapshot than the last. Use
+    `ConcurrentvEBTree.snapshot` to make several reads against one state.
+    """
+
+    def __init__(
+        self,
+        contents=(),
+        word_size=WORD_SIZE,
+        auto_shrink=False,
+        base=0,
+        auto_rebase=False,
+    ):
+        self._lock = threading.Lock()
+        self._tree = vEBTree(
+            contents,
+            word_size=word_size,
+            auto_shrink=auto_shrink,
+            base=base,
+            auto_rebase=auto_rebase,
+        )
+        self._publish()
+
+    def _publish(self):
+        self._published = self._tree.snapshot()
+
+    def __bool__(self):
+        return bool(self._published)
+
+    def __eq__(self, other):
+        return self._published == _unshared(other)
+
+    def __le__(self, other):
+        return self._published <= _unshared(other)
+
+    def __lt__(self, other):
+        return self._published < _unshared(other)
+
+    def __ge__(self, other):
+        return self._published >= _unshared(other)
+
+    def __gt__(self, other):
+        return self._published > _unshared(other)
+
+    def __repr__(self):
+        return f"ConcurrentvEBTree({list(self._published)!r})"
+
+    def __reduce__(self):
+        published = self._published
+        return self.__class__, (
+            list(published),
+            self.word_size,
+            self.auto_shrink,
+            published.base,
+            self.auto_rebase,
+        )
+
+    def __ior__(self, other):
+        with self._lock:
+            self._tree |= _unshared(other)
+            self._publish()
+        return self
+
+    def __iand__(self, other):
+        with self._lock:
+            self._tree &= _unshared(other)
+            self._publish()
+        return self
+
+    def __isub__(self, other):
+        with self._lock:
+            self._tree -= _unshared(other)
+            self._publish()
+        return self
+
+    def __ixor__(self, other):
+        with self._lock:
+            self._tree ^= _unshared(other)
+            self._publish()
+        return self
+
+    @property
+    def min(self):
+        return self._published.min
+
+    @property
+    def max(self):
+        return self._published.max
+
+    @property
+    def universe_size(self):
+        return self._published.universe_size
+
+    @property
+    def word_size(self):
+        return self._tree.word_size
+
+    @property
+    def auto_shrink(self):
+        return self._tree.auto_shrink
+
+    @property
+    def base(self):
+        return self._published.base
+
+    @property
+    def auto_rebase(self):
+        return self._tree.auto_rebase
+
+    def snapshot(self):
+        """
+        A private `vEBTree` of the current contents, made in constant time.
+        """
+        return self._published.snapshot()
+
+    def cursor(self, x):
+        """
+        A `vEBCursor` over a snapshot, starting at the smallest element >= x.
+        """
+        return self.snapshot().cursor(x)
+
+    def copy(self):
+        """
+        A new, independent `ConcurrentvEBTree` with the same contents.
+        """
+        tree = self.__class__(word_size=self.word_size)
+        tree._tree = self.snapshot()
+        tree._publish()
+        return tree
+
+    __copy__ = copy
+
+    def add(self, i):
+        with self._lock:
+            added = self._tree.add(i)
+            if added:
+                self._publish()
+        return added
+
+    def discard(self, i):
+        with self._lock:
+            discarded = self._tree.discard(i)
+            if discarded:
+                self._publish()
+        return discarded
+
+    def remove(self, i):
+        if not self.discard(i):
+            raise KeyError(i)
+
+    def pop(self):
+        return self.pop_min()
+
+    def clear(self):
+        with self._lock:
+            self._tree = vEBTree(
+                word_size=self.word_size,
+                auto_shrink=self.auto_shrink,
+                base=self._tree.base,
+                auto_rebase=self.auto_rebase,
+            )
+            self._publish()
+
+    push = add
+
+    __contains__ = _reader("__contains__")
+    __iter__ = _reader("__iter__")
+    __reversed__ = _reader("__reversed__")
+    __len__ = _reader("__len__")
+    __getitem__ = _reader("__getitem__")
+    contains_many = _reader("contains_many")
+    count_range = _reader("count_range")
+    irange = _reader("irange")
+    issubset = _reader("issubset")
+    issuperset = _reader("issuperset")
+    peek_max = _reader("peek_max")
+    peek_min = _reader("peek_min")
+    predecessor = _reader("predecessor")
+    predecessor_many = _reader("predecessor_many")
+    rank = _reader("rank")
+    select = _reader("select")
+    stats = _reader("stats")
+    successor = _reader("successor")
+    successor_many = _reader("successor_many")
+    to_array = _reader("to_array")
+    to_bytes = _reader("to_bytes")
+
+    compact = _writer("compact")
+    discard_range = _writer("discard_range")
+    grow = _writer("grow")
+    pop_max = _writer("pop_max")
+    pop_min = _writer("pop_min")
+    popn_min = _writer("popn_min")
+    shrink = _writer("shrink")
+    update = _writer("update")
+
+
+def _unshared(other):
+    """
+    A tree's published state, or any other object, for use as an operand.
+    """
+    if isinstance(other, ConcurrentvEBTree):
+        return other._published
+    return other
+
+
+def _collect_stats(node, stats, depth=1, in_summary=False):
+    """
+    Add the given node's (and its descendants') shape to a `stats` dict.
+    """
+    size = sys.getsizeof(node)
+    stats["depth"] = max(stats["depth"], depth)
+    if node.__class__ is _vEBLeaf:
+        stats["leaves"] += 1
+        size += sys.getsizeof(node.bits)
+    elif node.__class__ is _SortedNode:
+        stats["nodes"] += 1
+        size += sys.getsizeof(node.elements)
+    else:
+        stats["nodes"] += 1
+        size += sys.getsizeof(node.clusters)
+        if node._counts is not None:
+            size += sys.getsizeof(node._counts)
+        stats["cluster_slots"] += (
+            len(node.clusters)
+            if node.clusters.__class__ is list
+            else node.summary.size
+        )
+        stats["occupied_cluster_slots"] += node.summary.size
+        _collect_stats(node.summary, stats, depth + 1, True)
+        for high in node.summary:
+            _collect_stats(node.clusters[high], stats, depth + 1, in_summary)
+    if in_summary:
+        stats["summary_nodes"] += 1
+        stats["summary_bytes"] += size
+    stats["bytes"] += size
+
+
+def _numpy():
+    try:
+        np = import_module("numpy")
+    except ImportError:
+        raise ImportError(  # noqa: TRY003
+            "NumPy is required for array support (pip install veb[numpy]).",
+        ) from None
+    return np
+
+
+def _write_varint(data, n):
+    """
+    Append the (unsigned, little-endian base 128) encoding of ``n``.
+    """
+    while n > 0x7F:
+        data.append((n & 0x7F) | 0x80)
+        n >>= 7
+    data.append(n)
+
+
+def _read_varint(data, i):
+    """
+    Decode the varint at index ``i``, returning it and the index after it.
+    """
+    n = shift = 0
+    while True:
+        try:
+            byte = data[i]
+        except IndexError:
+            raise ValueError(  # noqa: TRY003
+                "truncated serialized vEBTree",
+            )
+        n |= (byte & 0x7F) << shift
+        i += 1
+        if byte < 0x80:
+            return n, i
+        shift += 7
+
+
+def _universe_for(n):
+    """
+    The smallest power of 2 universe size (at least 2) which can hold ``n``.
+    """
+    return 1 << max((n - 1).bit_length(), 1)
+
+
+def _grown_universe(root, to_size):
+    """
+    A universe fitting ``to_size`` into which the given root can be moved.
+
+    A universe's clusters have half of its bits (rounded down), theirs half
+    of theirs, and so on. The old root is moved over whole if its number of
+    bits comes up along the way, and otherwise its clusters are if theirs
+    does. Where that takes at most one more bit than is needed, the new
+    universe is the smallest where either of them does. Otherwise (as when
+    growing from an odd number of bits by less than double), it's the
+    smallest fitting ``to_size``, and the old root's clusters are rebuilt
+    (see `_rebuild`), lest every growth overshoot and the tree get deeper
+    than its elements need. A leaf is cheap enough to simply rebuild.
+    """
+    needed = (to_size - 1).bit_length()
+    if root.__class__ is _vEBLeaf:
+        return 1 << needed
+    bits = (root.universe_size - 1).bit_length()
+    fits = []
+    for aligned in bits, root._shift:
+        # universes whose bits halve k times down to aligned are those from
+        # aligned << k up to just before (aligned + 1) << k
+        k = 1
+        while ((aligned + 1) << k) <= needed:
+            k += 1
+        fits.append(max(needed, aligned << k))
+    fit = min(fits)
+    return 1 << (fit if fit <= needed + 1 else needed)
+
+
+def _shift_for(n):
+    """
+    How many of an element's low bits pick it out within its cluster.
+
+    That's half of the bits of a universe of size ``n``, rounded down, so
+    that there are at least as many clusters as there are elements in each.
+    """
+    return (n - 1).bit_length() // 2
+
+
+def _dtype_for(np, lo, hi):
+    """
+    A NumPy dtype for integers from ``lo`` through ``hi``.
+
+    That's ``int64`` wherever it fits, else ``uint64`` for non-negative
+    integers which fit that, and otherwise Python ints.
+    """
+    if lo is None or (-1 << 63 <= lo and hi < 1 << 63):
+        return np.int64
+    elif lo >= 0 and hi < 1 << 64:
+        return np.uint64
+    return object
+
+
+def _check_word_size(word_size):
+    if word_size < 2 or word_size & (word_size - 1):
+        raise ValueError(  # noqa: TRY003
+            f"word_size must be a power of 2, not {word_size!r}",
+        )
+
+
+def _node(n, word_size, owner=None):
+    """
+    A new empty node for a universe of size ``n`` (a power of 2).
+    """
+    if n <= word_size:
+        return _vEBLeaf(n, owner=owner)
+    return _vEBTree(n, word_size, owner=owner)
+
+
+def _by_cluster(elements, shift, start=0):
+    """
+    Split sorted elements into ``(high, lows)`` pairs, one per cluster.
+    """
+    mask = (1 << shift) - 1
+    i, end = start, len(elements)
+    while i < end:
+        high = elements[i] >> shift
+        j = bisect_left(elements, (high + 1) << shift, i, end)
+        yield high, [x & mask for x in elements[i:j]]
+        i = j
+
+
+def _from_sorted(n, word_size, elements, owner=None):
+    """
+    A new node for a universe of size ``n`` holding the given elements.
+
+    The elements must be distinct, ascending, and fit within the universe.
+    """
+    if n <= word_size:
+        bits = 0
+        for x in elements:
+            bits |= 1 << x
+        return _vEBLeaf(n, bits, owner)
+
+    if not elements:
+        return _vEBTree(n, word_size, owner=owner)
+
+    # the summary is only known once the clusters are, so start out without
+    node = _vEBTree(n, word_size, summary=_EMPTY, owner=owner)
+    shift, clusters = node._shift, node.clusters
+
+    highs = []
+    for high, lows in _by_cluster(elements, shift, start=1):
+        clusters[high] = _from_sorted(1 << shift, word_size, lows, owner)
+        highs.append(high)
+
+    node.summary = _from_sorted(n >> shift, word_size, highs, owner)
+    node.min, node.max, node.size = elements[0], elements[-1], len(elements)
+    return node
+
+
+def _root_from_sorted(n, word_size, elements):
+    """
+    Like `_from_sorted`, but for a tree's root, which may be a sorted list.
+    """
+    if n > word_size and len(elements) <= _MAX_SORTED:
+        return _SortedNode(n, elements)
+    return _from_sorted(n, word_size, elements)
+
+
+def _root_for(node):
+    """
+    The given node, or if it's small enough, a sorted list in its place.
+    """
+    if node.__class__ is _vEBTree and node.size <= _MAX_SORTED:
+        return _SortedNode(node.universe_size, node)
+    return node
+
+
+def _frame(a, b, base=None):
+    """
+    A base and universe size which fit the elements of both given trees.
+
+    If ``base`` is given, it's used instead, and the universe fits only
+    whichever elements are at least as large as it.
+    """
+    trees = [tree for tree in (a, b) if tree.universe_size]
+    if not trees:
+        return a.base if base is None else base, 0
+    if base is None:
+        base = min(tree.base for tree in trees)
+    top = max(tree.base + tree.universe_size for tree in trees)
+    return base, _universe_for(top - base) if top > base else 0
+
+
+def _resized(tree, n, word_size, base=0):
+    """
+    The root of the given tree, rebuilt if needed to have the given shape.
+
+    Elements outside of the universe starting at ``base`` are left out.
+    """
+    if (
+        tree.universe_size == n
+        and tree.word_size == word_size
+        and tree.base == base
+        and tree._root.__class__ is not _SortedNode
+    ):
+        return tree._root
+    return _from_sorted(
+        n, word_size, [x - base for x in tree.irange(base, base + n - 1)],
+    )
+
+
+def _copy(node, owner=None):
+    """
+    A deep copy of the given node, which ``owner`` may modify.
+    """
+    if node.__class__ is _vEBLeaf:
+        return _vEBLeaf(node.universe_size, node.bits, owner)
+
+    copy = _vEBTree(
+        node.universe_size,
+        node._word_size,
+        summary=_copy(node.summary, owner),
+        owner=owner,
+    )
+    clusters, copied = node.clusters, copy.clusters
+    for high in node.summary:
+        copied[high] = _copy(clusters[high], owner)
+    copy.min, copy.max, copy.size = node.min, node.max, node.size
+    return copy
+
+
+def _settle(node, clustered, extras=(), owner=None):
+    """
+    Fix up a node's minimum, maximum and size after its clusters change.
+
+    ``clustered`` is how many elements its clusters now hold, and ``extras``
+    are any further elements (which may repeat, or already be clustered).
+    The smallest of them all becomes the minimum.
+    """
+    shift, clusters = node._shift, node.clusters
+    extras = sorted(extras)
+    high = node.summary.min
+    node.size = clustered
+    if high is not None and (
+        not extras or (high << shift) | clusters[high].min <= extras[0]
+    ):
+        # the minimum lives outside of the clusters, so take it out
+        cluster = node._own_cluster(high, owner)
+        low = cluster.min
+        cluster.discard(low, owner)
+        node._count(high, -1)
+        if not cluster.size:
+            clusters[high] = None
+            node._own_summary(owner).discard(high, owner)
+        node.min = (high << shift) | low
+    elif extras:
+        node.min = extras.pop(0)
+        node.size += 1
+    else:
+        node.min = node.max = None
+        return
+
+    high = node.summary.max
+    if high is None:
+        node.max = node.min
+    else:
+        node.max = (high << shift) | clusters[high].max
+    for x in extras:
+        node.add(x, owner)
+
+
+def _assemble(n, word_size, clusters, extras=(), owner=None):
+    """
+    A new inner node made of whole clusters plus some extra elements.
+
+    The clusters are ``(high, cluster)`` pairs in ascending order, which must
+    be non-empty. They're shared with the new node, which ``owner`` may
+    modify (copying any cluster which isn't its own first).
+    """
+    node = _vEBTree(n, word_size, summary=_EMPTY, owner=owner)
+    highs, clustered = [], 0
+    for high, cluster in clusters:
+        node.clusters[high] = cluster
+        highs.append(high)
+        clustered += cluster.size
+    node.summary = _from_sorted(n >> node._shift, word_size, highs, owner)
+    _settle(node, clustered, extras, owner)
+    return node
+
+
+# Each of the set operations below builds a new node which ``owner`` may
+# modify, sharing whichever clusters only one of the two nodes has rather
+# than copying them. Neither node's tree may then modify its nodes in place
+# (see `vEBTree._share`).
+
+
+def _union(a, b, owner=None):
+    if a.__class__ is _vEBLeaf:
+        return _vEBLeaf(a.universe_size, a.bits | b.bits, owner)
+    elif not b.size:
+        return a
+    elif not a.size:
+        return b
+
+    clusters = []
+    for high in sorted({*a.summary, *b.summary}):
+        ours, theirs = a.clusters[high], b.clusters[high]
+        if theirs is None:
+            cluster = ours
+        elif ours is None:
+            cluster = theirs
+        else:
+            cluster = _union(ours, theirs, owner)
+        clusters.append((high, cluster))
+    return _assemble(
+        a.universe_size, a._word_size, clusters, {a.min, b.min}, owner,
+    )
+
+
+def _intersection(a, b, owner=None):
+    if a.__class__ is _vEBLeaf:
+        return _vEBLeaf(a.universe_size, a.bits & b.bits, owner)
+    elif not a.size or not b.size:
+        return _vEBTree(a.universe_size, a._word_size, owner=owner)
+
+    if b.summary.size < a.summary.size:
+        a, b = b, a
+    clusters = []
+    for high in a.summary:
+        theirs = b.clusters[high]
+        if theirs is not None:
+            cluster = _intersection(a.clusters[high], theirs, owner)
+            if cluster.size:
+                clusters.append((high, cluster))
+    extras = {x for x in (a.min, b.min) if x in a and x in b}
+    return _assemble(a.universe_size, a._word_size, clusters, extras, owner)
+
+
+def _difference(a, b, owner=None):
+    if a.__class__ is _vEBLeaf:
+        return _vEBLeaf(a.universe_size, a.bits & ~b.bits, owner)
+    elif not a.size or not b.size:
+        return a
+
+    clusters = []
+    for high in a.summary:
+        ours, theirs = a.clusters[high], b.clusters[high]
+        if theirs is None:
+            cluster = ours
+        else:
+            cluster = _difference(ours, theirs, owner)
+            if not cluster.size:
+                continue
+        clusters.append((high, cluster))
+    extras = () if a.min in b else (a.min,)
+    node = _assemble(a.universe_size, a._word_size, clusters, extras, owner)
+    # b's minimum isn't in its clusters, so it may still be here
+    node.discard(b.min, owner)
+    return node
+
+
+def _symmetric_difference(a, b, owner=None):
+    if a.__class__ is _vEBLeaf:
+        return _vEBLeaf(a.universe_size, a.bits ^ b.bits, owner)
+    elif not b.size:
+        return a
+    elif not a.size:
+        return b
+
+    clusters = []
+    for high in sorted({*a.summary, *b.summary}):
+        ours, theirs = a.clusters[high], b.clusters[high]
+        if theirs is None:
+            cluster = ours
+        elif ours is None:
+            cluster = theirs
+        else:
+            cluster = _symmetric_difference(ours, theirs, owner)
+            if not cluster.size:
+                continue
+        clusters.append((high, cluster))
+    node = _assemble(a.universe_size, a._word_size, clusters, owner=owner)
+    # neither minimum is in its own clusters, so each is toggled on its own
+    for x in a.min, b.min:
+        if not node.discard(x, owner):
+            node.add(x, owner)
+    return node
+
+
+# The in-place counterparts of the set operations modify ``a`` (which must
+# be ``owner``'s) and return the result, which is ``a`` itself unless noted.
+# They visit only clusters which ``b`` has, leaving the rest of ``a`` alone,
+# and copy (rather than share) those clusters which only ``b`` has.
+
+
+def _union_into(a, b, owner):
+    """
+    Add the elements of ``b`` to ``a``, returning a new node if it's empty.
+    """
+    if a.__class__ is _vEBLeaf:
+        a.bits |= b.bits
+        a.size = bin(a.bits).count("1")
+        return a
+    elif not b.size:
+        return a
+    elif not a.size:
+        return _copy(b, owner)
+
+    clusters, clustered, new_highs = a.clusters, a.size - 1, []
+    for high in b.summary:
+        ours, theirs = clusters[high], b.clusters[high]
+        if ours is None:
+            clusters[high] = _copy(theirs, owner)
+            new_highs.append(high)
+            added = theirs.size
+        else:
+            ours = a._own_cluster(high, owner)
+            added = -ours.size
+            _union_into(ours, theirs, owner)
+            added += ours.size
+        a._count(high, added)
+        clustered += added
+    if new_highs:
+        a._own_summary(owner).update(new_highs, owner)
+    # the old minimum is in none of the clusters, so it goes back in too
+    _settle(a, clustered, (a.min, b.min), owner)
+    return a
+
+
+def _intersection_into(a, b, owner):
+    """
+    Discard the elements of ``a`` which aren't in ``b``.
+
+    Clusters only ``a`` has are dropped whole. If ``b`` has fewer clusters,
+    a new node is built from them instead.
+    """
+    if a.__class__ is _vEBLeaf:
+        a.bits &= b.bits
+        a.size = bin(a.bits).count("1")
+        return a
+    elif not a.size:
+        return a
+    elif b.summary.size < a.summary.size:
+        return _intersection(a, b, owner)
+
+    extras = [x for x in (a.min, b.min) if x in a and x in b]
+    clusters, clustered = a.clusters, a.size - 1
+    summary = a._own_summary(owner)
+    for high in list(summary):
+        ours, theirs = clusters[high], b.clusters[high]
+        size = ours.size
+        if theirs is not None:
+            ours = clusters[high] = _intersection_into(
+                a._own_cluster(high, owner), theirs, owner,
+            )
+        if theirs is None or not ours.size:
+            clusters[high] = None
+            summary.discard(high, owner)
+            a._count(high, -size)
+            clustered -= size
+        else:
+            a._count(high, ours.size - size)
+            clustered += ours.size - size
+    _settle(a, clustered, extras, owner)
+    return a
+
+
+def _difference_into(a, b, owner):
+    """
+    Discard the elements of ``b`` from ``a``.
+    """
+    if a.__class__ is _vEBLeaf:
+        a.bits &= ~b.bits
+        a.size = bin(a.bits).count("1")
+        return a
+    elif not a.size or not b.size:
+        return a
+
+    extras = () if a.min in b else (a.min,)
+    clusters, clustered, emptied = a.clusters, a.size - 1, []
+    # only clusters both have matter, so look through whichever has fewer
+    highs = a.summary if a.summary.size < b.summary.size else b.summary
+    for high in highs:
+        ours, theirs = clusters[high], b.clusters[high]
+        if ours is None or theirs is None:
+            continue
+        ours = a._own_cluster(high, owner)
+        removed = ours.size
+        _difference_into(ours, theirs, owner)
+        removed -= ours.size
+        a._count(high, -removed)
+        clustered -= removed
+        if not ours.size:
+            clusters[high] = None
+            emptied.append(high)
+    if emptied:
+        summary = a._own_summary(owner)
+        for high in emptied:
+            summary.discard(high, owner)
+    _settle(a, clustered, extras, owner)
+    # b's minimum isn't in its clusters, so it may still be here
+    a.discard(b.min, owner)
+    return a
+
+
+def _symmetric_difference_into(a, b, owner):
+    """
+    Toggle each element of ``b`` in ``a``, returning a new node if it's empty.
+    """
+    if a.__class__ is _vEBLeaf:
+        a.bits ^= b.bits
+        a.size = bin(a.bits).count("1")
+        return a
+    elif not b.size:
+        return a
+    elif not a.size:
+        return _copy(b, owner)
+
+    clusters, clustered = a.clusters, a.size - 1
+    new_highs, emptied = [], []
+    for high in b.summary:
+        ours, theirs = clusters[high], b.clusters[high]
+        if ours is None:
+            clusters[high] = _copy(theirs, owner)
+            new_highs.append(high)
+            change = theirs.size
+        else:
+            ours = a._own_cluster(high, owner)
+            change = -ours.size
+            _symmetric_difference_into(ours, theirs, owner)
+            change += ours.size
+            if not ours.size:
+                clusters[high] = None
+                emptied.append(high)
+        a._count(high, change)
+        clustered += change
+    if new_highs or emptied:
+        summary = a._own_summary(owner)
+        if new_highs:
+            summary.update(new_highs, owner)
+        for high in emptied:
+            summary.discard(high, owner)
+    minimum = a.min
+    _settle(a, clustered, owner=owner)
+    # neither minimum is in its own clusters, so each is toggled on its own
+    for x in minimum, b.min:
+        if not a.discard(x, owner):
+            a.add(x, owner)
+    return a
+
+
+def _is_subset(a, b, extras=()):
+    """
+    Whether each element of ``a`` is either in ``b`` or one of ``extras``.
+    """
+    if not a.size:
+        return True
+    elif a.size > b.size + len(extras):
+        return False
+    elif a.__class__ is _vEBLeaf:
+        bits = b.bits
+        for x in extras:
+            bits |= 1 << x
+        return not a.bits & ~bits
+    elif not b.size:
+        return all(x in extras for x in a)
+
+    for x in a.min, a.max:
+        if x not in b and x not in extras:
+            return False
+
+    shift = a._shift
+    mask = (1 << shift) - 1
+    extras = (*extras, b.min)
+    for high in a.summary:
+        lows = tuple(x & mask for x in extras if x >> shift == high)
+        ours, theirs = a.clusters[high], b.clusters[high]
+        if theirs is None:
+            if not all(x in lows for x in ours):
+                return False
+        elif not _is_subset(ours, theirs, lows):
+            return False
+    return True
+
+
+def _equal(a, b):
+    if a.size != b.size or a.min != b.min or a.max != b.max:
+        return False
+    elif a.__class__ is _vEBLeaf:
+        return a.bits == b.bits
+    elif _SortedNode in (a.__class__, b.__class__):
+        return all(x == y for x, y in zip(a, b))
+    elif not a.size:
+        return True
+
+    clusters = b.clusters
+    return _equal(a.summary, b.summary) and all(
+        _equal(a.clusters[high], clusters[high]) for high in a.summary
+    )
+
+
+def _ascending(bits):
+    """
+    The positions of the set bits in the given int, from lowest to highest.
+    """
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+
+def _descending(bits):
+    """
+    The positions of the set bits in the given int, from highest to lowest.
+    """
+    while bits:
+        highest = bits.bit_length() - 1
+        yield highest
+        bits ^= 1 << highest
+
+
+def _rebuild(n, word_size, pieces, loose=(), owner=None):
+    """
+    A node for a universe of size ``n``, reusing existing nodes where it can.
+
+    ``pieces`` are ascending ``(base, node)`` pairs, each contributing the
+    elements ``base + x`` for ``x`` in ``node``, where ``base`` is a multiple
+    of the node's universe size. They are taken over and may be modified.
+    ``loose`` are any further elements. Pieces which don't belong to
+    ``owner`` are copied before being modified.
+
+    Pieces too big to be clusters here are broken up into their own
+    clusters, and pieces which are exactly the size of a cluster are reused
+    as-is. Pieces smaller than a cluster are merged into a new one, so the
+    cost depends on how the pieces line up with this layout. Where they
+    never do, every node is rebuilt, down to the leaves (which is why
+    `_grown_universe` picks a universe where they do, if there's one close
+    enough to the size needed).
+    """
+    if n <= word_size:
+        bits = 0
+        for base, piece in pieces:
+            if piece.__class__ is _vEBLeaf:
+                bits |= piece.bits << base
+            else:
+                for x in piece:
+                    bits |= 1 << (base + x)
+        for x in loose:
+            bits |= 1 << x
+        return _vEBLeaf(n, bits, owner)
+    elif len(pieces) == 1 and not loose and pieces[0][1].universe_size == n:
+        return pieces[0][1]
+
+    shift = _shift_for(n)
+    lower, mask = 1 << shift, (1 << shift) - 1
+
+    fitting, loose = [], list(loose)
+
+    def split(base, piece):
+        if piece.universe_size <= lower:
+            fitting.append((base, piece))
+        elif piece.__class__ is _vEBLeaf:
+            loose.extend(base + x for x in piece)
+        else:
+            loose.append(base + piece.min)
+            piece_shift = piece._shift
+            for high in piece.summary:
+                split(base + (high << piece_shift), piece.clusters[high])
+
+    for base, piece in pieces:
+        split(base, piece)
+
+    # the minimum isn't kept in a cluster, so if it's loose, leave it out
+    # rather than have its cluster rebuilt just to take it out again
+    extras = ()
+    if loose:
+        low = min(loose)
+        if not fitting or low < fitting[0][0] + fitting[0][1].min:
+            loose.remove(low)
+            extras = (low,)
+
+    groups = {}
+    for base, piece in fitting:
+        groups.setdefault(base >> shift, ([], []))[0].append(
+            (base & mask, piece),
+        )
+    for x in loose:
+        groups.setdefault(x >> shift, ([], []))[1].append(x & mask)
+
+    clusters = [
+        (high, _rebuild(lower, word_size, *groups[high], owner))
+        for high in sorted(groups)
+    ]
+    return _assemble(n, word_size, clusters, extras, owner)
 
 
 class _vEBLeaf:
-    universe_size = 2
+    """
+    The bottom of the tree, holding up to a machine word of bits in an int.
+    """
+
+    __slots__ = ("bits", "size", "universe_size", "_owner")
 
-    def __init__(self):
-        self.values = [False, False]
+    def __init__(self, n, bits=0, owner=None):
+        self.bits = bits
+        self.size = bin(bits).count("1")
+        self.universe_size = n
+        self._owner = owner
 
     def __contains__(self, x):
-        if x > 2:
+        return 0 <= x < self.universe_size and (self.bits >> x) & 1 == 1
+
+    def __iter__(self):
+        return _ascending(self.bits)
+
+    def __len__(self):
+        return self.size
+
+    def __reversed__(self):
+        return _descending(self.bits)
+
+    @property
+    def min(self):
+        bits = self.bits
+        if not bits:
+            return None
+        return (bits & -bits).bit_length() - 1
+
+    @property
+    def max(self):
+        return self.bits.bit_length() - 1 if self.bits else None
+
+    def _copy_for(self, owner):
+        copy = _vEBLeaf(self.universe_size, self.bits)
+        copy._owner = owner
+        return copy
+
+    def add(self, x, owner=None):
+        bit = 1 << x
+        if self.bits & bit:
+            return False
+        self.bits |= bit
+        self.size += 1
+        return True
+
+    def discard(self, x, owner=None):
+        if x not in self:
             return False
-        return self.values[x]
+        self.bits ^= 1 << x
+        self.size -= 1
+        return True
+
+    def update(self, elements, owner=None):
+        bits = self.bits
+        for x in elements:
+            bits |= 1 << x
+        self.bits = bits
+        added, self.size = -self.size, bin(bits).count("1")
+        return added + self.size
+
+    def irange(self, lo, hi):
+        return _ascending(self.bits & ((1 << (hi + 1)) - (1 << lo)))
+
+    def irange_reversed(self, lo, hi):
+        return _descending(self.bits & ((1 << (hi + 1)) - (1 << lo)))
+
+    def count_range(self, lo, hi):
+        return bin(self.bits & ((1 << (hi + 1)) - (1 << lo))).count("1")
+
+    def rank(self, x):
+        return bin(self.bits & ((1 << x) - 1)).count("1")
+
+    def contains_many(self, xs):
+        bits = self.bits
+        return [(bits >> x) & 1 == 1 for x in xs]
+
+    def successor_many(self, xs):
+        return [self.successor(x) for x in xs]
+
+    def predecessor_many(self, xs):
+        return [self.predecessor(x) for x in xs]
+
+    def select(self, k):
+        bits = self.bits
+        for _ in range(k):
+            bits &= bits - 1
+        return (bits & -bits).bit_length() - 1
+
+    def discard_range(self, lo, hi, owner=None):
+        in_range = self.bits & ((1 << (hi + 1)) - (1 << lo))
+        removed = bin(in_range).count("1")
+        self.bits ^= in_range
+        self.size -= removed
+        return removed
+
+    def predecessor(self, x):
+        if x <= 0:
+            return None
+        bits = self.bits & ((1 << min(x, self.universe_size)) - 1)
+        return bits.bit_length() - 1 if bits else None
+
+    def successor(self, x):
+        bits = self.bits >> (x + 1) << (x + 1) if x >= 0 else self.bits
+        if not bits:
+            return None
+        return (bits & -bits).bit_length() - 1
+
+
+class _SortedNode:
+    """
+    The root of a small tree, holding its elements in a sorted list.
+
+    A handful of elements spread over a large universe would otherwise each
+    need their own chain of nodes down to a leaf. Searching a short list is
+    also quicker than descending through those nodes.
+    """
+
+    __slots__ = ("elements", "universe_size", "_owner")
+
+    def __init__(self, n, elements=()):
+        self.elements = list(elements)
+        self.universe_size = n
+        self._owner = None
+
+    def __contains__(self, x):
+        elements = self.elements
+        i = bisect_left(elements, x)
+        return i != len(elements) and elements[i] == x
 
     def __iter__(self):
-        return (i for i, v in enumerate(self.values) if v)
+        return iter(self.elements)
 
     def __len__(self):
-        return self.values.count(True)
+        return len(self.elements)
 
     def __reversed__(self):
-        return (i for i, v in zip((1, 0), reversed(self.values)) if v)
+        return reversed(self.elements)
+
+    @property
+    def size(self):
+        return len(self.elements)
 
     @property
     def min(self):
-        return next(iter(self), None)
+        return self.elements[0] if self.elements else None
 
     @property
     def max(self):
-        return next(reversed(self), None)
+        return self.elements[-1] if self.elements else None
 
-    def add(self, x):
-        self.values[x] = True
+    def _copy_for(self, owner):
+        copy = _SortedNode(self.universe_size, self.elements)
+        copy._owner = owner
+        return copy
 
-    def discard(self, x):
-        self.values[x] = False
+    def add(self, x, owner=None):
+        elements = self.elements
+        i = bisect_left(elements, x)
+        if i != len(elements) and elements[i] == x:
+            return False
+        elements.insert(i, x)
+        return True
+
+    def discard(self, x, owner=None):
+        elements = self.elements
+        i = bisect_left(elements, x)
+        if i == len(elements) or elements[i] != x:
+            return False
+        del elements[i]
+        return True
+
+    def update(self, elements, owner=None):
+        size = len(self.elements)
+        self.elements = sorted(set(self.elements).union(elements))
+        return len(self.elements) - size
+
+    def irange(self, lo, hi):
+        elements = self.elements
+        return iter(
+            elements[bisect_left(elements, lo):bisect_right(elements, hi)],
+        )
+
+    def irange_reversed(self, lo, hi):
+        elements = self.elements
+        return reversed(
+            elements[bisect_left(elements, lo):bisect_right(elements, hi)],
+        )
+
+    def count_range(self, lo, hi):
+        elements = self.elements
+        return bisect_right(elements, hi) - bisect_left(elements, lo)
+
+    def rank(self, x):
+        return bisect_left(self.elements, x)
+
+    def contains_many(self, xs):
+        return [x in self for x in xs]
+
+    def successor_many(self, xs):
+        return [self.successor(x) for x in xs]
+
+    def predecessor_many(self, xs):
+        return [self.predecessor(x) for x in xs]
+
+    def select(self, k):
+        return self.elements[k]
+
+    def discard_range(self, lo, hi, owner=None):
+        elements = self.elements
+        start, stop = bisect_left(elements, lo), bisect_right(elements, hi)
+        del elements[start:stop]
+        return stop - start
 
     def predecessor(self, x):
-        if x < 1:
-            return
-        elif x == 1:
-            return 0 if self.values[0] else None
-        else:
-            return 1 if self.values[1] else 0 if self.values[0] else None
+        elements = self.elements
+        i = bisect_left(elements, x)
+        return elements[i - 1] if i else None
 
     def successor(self, x):
-        if x > 0:
-            return
-        elif x == 0:
-            return 1 if self.values[1] else None
+        elements = self.elements
+        i = bisect_right(elements, x)
+        return elements[i] if i != len(elements) else None
+
+
+class _SparseClusters(dict):
+    """
+    Clusters keyed by their high bits, for nodes with too many to allocate.
+
+    Missing clusters are `None`, just as in the list used by smaller nodes,
+    and setting one to `None` removes it, so memory follows the number of
+    clusters in use rather than the size of the universe.
+    """
+
+    __slots__ = ()
+
+    def __missing__(self, high):
+        return None
+
+    def __setitem__(self, high, cluster):
+        if cluster is None:
+            self.pop(high, None)
         else:
-            return 0 if self.values[0] else 1 if self.values[1] else None
+            dict.__setitem__(self, high, cluster)
 
 
-class _vEBTree:
-    min = max = None
+class _SharedClusters:
+    """
+    A node's sparse clusters, once the node has been shared with a snapshot.
+
+    Behaves just as `_SparseClusters` does, but the clusters are kept in a
+    dict only until it grows past `_MAX_BUCKET`, and then in a shallow trie
+    of such dicts, split on successive groups of the clusters' lowest bits.
+    A copy shares the whole trie, and copies only the path down to whichever
+    dict it goes on to change, so that copying a node on write doesn't cost
+    in proportion to how many clusters it has. Looking clusters up through
+    the trie is slower though, so nodes switch to it only when first copied.
+    """
+
+    __slots__ = ("_owner", "_root")
+
+    def __init__(self, root=None):
+        # what the dicts this map may modify belong to (which isn't the map
+        # itself, so as not to make a reference cycle of every node)
+        self._owner = owner = object()
+        if root is None:
+            root = _Bucket()
+            root.owner = owner
+        self._root = root
+
+    @classmethod
+    def from_dict(cls, clusters):
+        shared = cls()
+        bucket = shared._root
+        bucket.update(clusters)
+        if len(bucket) > _MAX_BUCKET:
+            shared._root = _split(bucket, 0, shared._owner)
+        return shared
+
+    def __contains__(self, high):
+        return self[high] is not None
+
+    def __getitem__(self, high):
+        node, shift = self._root, 0
+        while node.__class__ is _Branch:
+            node = node[(high >> shift) & _BRANCH_MASK]
+            shift += _BRANCH_BITS
+        return node.get(high)
+
+    def __len__(self):
+        return sum(
+            len(node) for node in self._nodes() if node.__class__ is _Bucket
+        )
+
+    def __setitem__(self, high, cluster):
+        owner, node = self._owner, self._root
+        if node.owner is not owner:
+            node = self._root = node.copy_for(owner)
+        parent = index = None
+        shift = 0
+        while node.__class__ is _Branch:
+            parent, index = node, (high >> shift) & _BRANCH_MASK
+            node = parent[index]
+            if node.owner is not owner:
+                node = parent[index] = node.copy_for(owner)
+            shift += _BRANCH_BITS
+
+        if cluster is not None:
+            node[high] = cluster
+            if len(node) > _MAX_BUCKET:
+                node = _split(node, shift, owner)
+                if parent is None:
+                    self._root = node
+                else:
+                    parent[index] = node
+        else:
+            node.pop(high, None)
+            if not node and parent is not None:
+                parent[index] = _NO_CLUSTERS
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sum(
+            sys.getsizeof(node) for node in self._nodes()
+        )
+
+    def _nodes(self):
+        """
+        The dicts and branches making up this map.
+        """
+        nodes = [self._root]
+        while nodes:
+            node = nodes.pop()
+            yield node
+            if node.__class__ is _Branch:
+                nodes.extend(each for each in node if each is not _NO_CLUSTERS)
+
+    def copy(self):
+        return _SharedClusters(self._root)
+
+
+class _Bucket(dict):
+    """
+    Some of a sparse node's clusters, modifiable by whichever owns it.
+    """
+
+    __slots__ = ("owner",)
+
+    def copy_for(self, owner):
+        copy = _Bucket(self)
+        copy.owner = owner
+        return copy
 
-    def __init__(self, n):
-        root = ceil(log2(n)) / 2
-        upper, self._lower = 1 << ceil(root), 1 << floor(root)
-        self.summary = vEBTree.of_size(upper)
-        self.clusters = [None] * upper
+
+class _Branch(list):
+    """
+    A sparse node's clusters, split up by a few more of their low bits.
+    """
+
+    __slots__ = ("owner",)
+
+    def copy_for(self, owner):
+        copy = _Branch(self)
+        copy.owner = owner
+        return copy
+
+
+#: the (never modified) bucket standing in for empty parts of a branch
+_NO_CLUSTERS = _Bucket()
+_NO_CLUSTERS.owner = None
+_BRANCH_MASK = (1 << _BRANCH_BITS) - 1
+
+
+def _split(bucket, shift, owner):
+    """
+    Split an overfull bucket into a branch on the next bits above ``shift``.
+    """
+    branch = _Branch([_NO_CLUSTERS] * (1 << _BRANCH_BITS))
+    branch.owner = owner
+    for high, cluster in bucket.items():
+        index = (high >> shift) & _BRANCH_MASK
+        child = branch[index]
+        if child is _NO_CLUSTERS:
+            child = branch[index] = _Bucket()
+            child.owner = owner
+        child[high] = cluster
+    for index, child in enumerate(branch):
+        if len(child) > _MAX_BUCKET:
+            branch[index] = _split(child, shift + _BRANCH_BITS, owner)
+    return branch
+
+
+class _vEBTree:
+    """
+    An inner node, whose clusters and summary are themselves bare nodes.
+    """
+
+    __slots__ = (
+        "clusters",
+        "max",
+        "min",
+        "size",
+        "summary",
+        "universe_size",
+        "_counts",
+        "_owner",
+        "_shift",
+        "_word_size",
+    )
+
+    def __init__(self, n, word_size, summary=None, owner=None):
+        self._shift = _shift_for(n)
+        upper = n >> self._shift
+        if summary is None:
+            summary = _node(upper, word_size, owner)
+        self.summary = summary
+        if upper > _MAX_DENSE_CLUSTERS:
+            self.clusters = _SparseClusters()
+        else:
+            self.clusters = [None] * upper
         self.universe_size = n
+        self._word_size = word_size
+        self.min = self.max = self._counts = None
+        self._owner = owner
+        self.size = 0
 
     def __contains__(self, x):
-        if self.min is None:
+        if self.min is None or x < self.min or x > self.max:
             return False
-        elif x == self.min:
+        elif x == self.min or x == self.max:
             return True
 
-        high, low = divmod(x, self._lower)
-        if self.clusters[high] is None:
+        shift = self._shift
+        cluster = self.clusters[x >> shift]
+        if cluster is None:
             return False
-        return low in self.clusters[high]
+        return x & ((1 << shift) - 1) in cluster
 
     def __iter__(self):
-        i, _ = minimum, maximum = self.min, self.max
-
-        if minimum is None:
+        if self.min is None:
             return
-        yield minimum
+        yield self.min
 
-        while i != maximum:
-            i = self.successor(i)
-            yield i
+        # walk the clusters in summary order rather than re-descending from
+        # the top for each successor
+        shift, clusters = self._shift, self.clusters
+        for high in self.summary:
+            base = high << shift
+            for low in clusters[high]:
+                yield base | low
 
     def __reversed__(self):
-        _, i = minimum, maximum = self.min, self.max
-
-        if minimum is None:
+        if self.min is None:
             return
-        yield maximum
 
-        while i != minimum:
-            i = self.predecessor(i)
-            yield i
+        shift, clusters = self._shift, self.clusters
+        for high in reversed(self.summary):
+            base = high << shift
+            for low in reversed(clusters[high]):
+                yield base | low
 
-    def __len__(self):
-        return sum(1 for _ in self)
+        yield self.min
 
-    def add(self, x):
+    def __len__(self):
+        return self.size
+
+    def _copy_for(self, owner):
+        """
+        A shallow copy of this node, which ``owner`` may then modify.
+
+        Nodes are shared between a tree and its snapshots, and each mutating
+        method is passed the ``owner`` of the tree doing the modifying. Any
+        child which isn't that owner's is copied (this way) before it's
+        modified, so only the path leading to a change is ever copied.
+        """
+        clusters = self.clusters
+        if clusters.__class__ is _SparseClusters:
+            # this node won't be modified again, so can switch to clusters
+            # which its copies can share
+            clusters = self.clusters = _SharedClusters.from_dict(clusters)
+
+        copy = _vEBTree.__new__(_vEBTree)
+        copy.clusters = clusters.copy()
+        copy.summary = self.summary
+        copy.min, copy.max, copy.size = self.min, self.max, self.size
+        copy.universe_size = self.universe_size
+        copy._shift, copy._word_size = self._shift, self._word_size
+        # the cluster counts are rebuilt when next needed, rather than copied
+        copy._owner, copy._counts = owner, None
+        return copy
+
+    def _cluster_counts(self):
+        """
+        A Fenwick tree of the clusters' sizes, if there are enough of them.
+
+        Up to a few dozen clusters are quicker to simply add up. Otherwise it's
+        built the first time it's needed, and from then on kept up to
+        date as clusters change.
+        """
+        counts, summary = self._counts, self.summary
+        if counts is None and summary.size > _MAX_DENSE_CLUSTERS:
+            upper, clusters = summary.universe_size, self.clusters
+            if upper <= _MAX_DENSE_CLUSTERS * summary.size:
+                counts = array("q", [0]) * (upper + 1)
+                for high in summary:
+                    counts[high + 1] = clusters[high].size
+                for i in range(1, upper + 1):
+                    j = i + (i & -i)
+                    if j <= upper:
+                        counts[j] += counts[i]
+            else:
+                counts = Counter()
+                for high in summary:
+                    size, i = clusters[high].size, high + 1
+                    while i <= upper:
+                        counts[i] += size
+                        i += i & -i
+            self._counts = counts
+        return counts
+
+    def _count(self, high, delta):
+        """
+        Adjust the cluster counts (if kept) for a change in a cluster's size.
+        """
+        counts = self._counts
+        if counts is not None:
+            upper, i = self.summary.universe_size, high + 1
+            while i <= upper:
+                counts[i] += delta
+                i += i & -i
+
+    def _count_before(self, high):
+        """
+        How many clustered elements are in clusters before ``high``.
+        """
+        counts, total = self._counts, 0
+        while high:
+            total += counts[high]
+            high &= high - 1
+        return total
+
+    def _own_cluster(self, high, owner):
+        """
+        The given (present) cluster, first copied if it isn't ``owner``'s.
+        """
+        cluster = self.clusters[high]
+        if cluster._owner is not owner:
+            cluster = self.clusters[high] = cluster._copy_for(owner)
+        return cluster
+
+    def _own_summary(self, owner):
+        """
+        The summary, first copied if it isn't ``owner``'s.
+        """
+        summary = self.summary
+        if summary._owner is not owner:
+            summary = self.summary = summary._copy_for(owner)
+        return summary
+
+    def add(self, x, owner=None):
         if self.min is None:
             self.min = self.max = x
-            return
+            self.size = 1
+            return True
 
         if x == self.min:
-            return
-        self.min = min(x, self.min)
-        self.max = max(x, self.max)
+            return False
+        elif x < self.min:
+            # the minimum is never stored in a cluster, so the old one is what
+            # needs pushing down now
+            x, self.min = self.min, x
 
-        high, low = divmod(x, self._lower)
+        shift = self._shift
+        high = x >> shift
         cluster = self.clusters[high]
 
         if cluster is None:
-            cluster = self.clusters[high] = vEBTree.of_size(
-                self.summary.universe_size,
-            )
-            self.summary.add(high)
-        cluster.add(low)
+            cluster = self.clusters[high] = _node(1 << shift, self._word_size)
+            self._own_summary(owner).add(high, owner)
+        elif cluster._owner is not owner:
+            cluster = self.clusters[high] = cluster._copy_for(owner)
+        if not cluster.add(x & ((1 << shift) - 1), owner):
+            return False
+        if self._counts is not None:
+            self._count(high, 1)
 
-    def discard(self, x):
-        if self.min is None or x < self.min:
-            return
+        self.max = max(self.max, x)
+        self.size += 1
+        return True
+
+    def discard(self, x, owner=None):
+        if self.min is None or x < self.min or x > self.max:
+            return False
 
+        shift = self._shift
         if x == self.min:
-            new_min_in = self.summary.min
-            if new_min_in is None:
+            high = self.summary.min
+            if high is None:
                 self.min = self.max = None
+                self.size = 0
+                return True
+            # pull the smallest clustered element up to be the new minimum,
+            # and then remove it from its cluster below
+            cluster = self._own_cluster(high, owner)
+            low = cluster.min
+            x = self.min = (high << shift) | low
+            cluster.discard(low, owner)
+        else:
+            high, low = x >> shift, x & ((1 << shift) - 1)
+            cluster = self.clusters[high]
+            if cluster is None:
+                return False
+            elif cluster._owner is not owner:
+                if low not in cluster:
+                    return False
+                cluster = self.clusters[high] = cluster._copy_for(owner)
+            if not cluster.discard(low, owner):
+                return False
+
+        if self._counts is not None:
+            self._count(high, -1)
+        if not cluster.size:
+            self.clusters[high] = None
+            self._own_summary(owner).discard(high, owner)
+        self.size -= 1
+
+        if x == self.max:
+            global_max = self.summary.max
+            if global_max is None:
+                self.max = self.min
             else:
-                cluster = self.clusters[new_min_in]
-                new_min = cluster.min
-                x = self.min = new_min_in * self._lower + new_min
-                # XXX: I don't know why just changing to
-                # cluster.discard(new_min_in) and returning doesn't work here
+                self.max = (
+                    (global_max << shift) | self.clusters[global_max].max
+                )
+        return True
+
+    def update(self, elements, owner=None):
+        """
+        Add the given sorted, distinct elements, returning how many were new.
+        """
+        minimum, added = self.min, 0
+        if minimum is None:
+            self.min = self.max = elements[0]
+            added, elements = 1, elements[1:]
+        else:
+            i = bisect_left(elements, minimum)
+            if i < len(elements) and elements[i] == minimum:
+                elements = elements[:i] + elements[i + 1:]
+            if i:
+                # a new minimum, so the old one gets pushed down as in add (and
+                # then is counted below as new, in place of the new minimum)
+                self.min = elements[0]
+                elements = elements[1:i] + [minimum] + elements[i:]
+
+        shift, clusters, new_highs = self._shift, self.clusters, []
+        for high, lows in _by_cluster(elements, shift):
+            cluster = clusters[high]
+            if cluster is None:
+                clusters[high] = _from_sorted(
+                    1 << shift, self._word_size, lows,
+                )
+                new_highs.append(high)
+                new = len(lows)
+            else:
+                if cluster._owner is not owner:
+                    cluster = clusters[high] = cluster._copy_for(owner)
+                new = cluster.update(lows, owner)
+            self._count(high, new)
+            added += new
+        if new_highs:
+            self._own_summary(owner).update(new_highs, owner)
+
+        if elements and elements[-1] > self.max:
+            self.max = elements[-1]
+        self.size += added
+        return added
+
+    def irange(self, lo, hi):
+        """
+        The elements between ``lo`` and ``hi`` inclusive, in ascending order.
+        """
+        if self.min is None or lo > self.max or hi < self.min:
+            return
+        if lo <= self.min:
+            yield self.min
+
+        shift = self._shift
+        mask = (1 << shift) - 1
+        lo_high, hi_high = lo >> shift, hi >> shift
+        for high in self.summary.irange(lo_high, hi_high):
+            cluster, base = self.clusters[high], high << shift
+            low = lo & mask if high == lo_high else 0
+            top = hi & mask if high == hi_high else mask
+            for x in cluster.irange(low, top):
+                yield base | x
+
+    def irange_reversed(self, lo, hi):
+        """
+        The elements between ``lo`` and ``hi`` inclusive, in descending order.
+        """
+        if self.min is None or lo > self.max or hi < self.min:
+            return
+
+        shift = self._shift
+        mask = (1 << shift) - 1
+        lo_high, hi_high = lo >> shift, hi >> shift
+        for high in self.summary.irange_reversed(lo_high, hi_high):
+            cluster, base = self.clusters[high], high << shift
+            low = lo & mask if high == lo_high else 0
+            top = hi & mask if high == hi_high else mask
+            for x in cluster.irange_reversed(low, top):
+                yield base | x
+
+        if lo <= self.min:
+            yield self.min
+
+    def count_range(self, lo, hi):
+        """
+        How many elements are between ``lo`` and ``hi`` inclusive.
+        """
+        if self.min is None or lo > self.max or hi < self.min:
+            return 0
+        count = 1 if lo <= self.min else 0
+
+        shift = self._shift
+        mask = (1 << shift) - 1
+        lo_high, hi_high = lo >> shift, hi >> shift
+        clusters = self.clusters
+        if lo_high == hi_high:
+            cluster = clusters[lo_high]
+            if cluster is not None:
+                count += cluster.count_range(lo & mask, hi & mask)
+            return count
+
+        # only the clusters at either end can be partially in the range
+        if self._cluster_counts() is None:
+            for high in self.summary.irange(lo_high + 1, hi_high - 1):
+                count += clusters[high].size
+        else:
+            count += (
+                self._count_before(hi_high)
+                - self._count_before(lo_high + 1)
+            )
+        if clusters[lo_high] is not None:
+            count += clusters[lo_high].count_range(lo & mask, mask)
+        if clusters[hi_high] is not None:
+            count += clusters[hi_high].count_range(0, hi & mask)
+        return count
+
+    def discard_range(self, lo, hi, owner=None):
+        """
+        Discard the elements between ``lo`` and ``hi`` inclusive.
+
+        Returns how many elements were discarded.
+        """
+        if self.min is None or lo > self.max or hi < self.min:
+            return 0
+
+        removed = self.size
+        if lo <= self.min and hi >= self.max:
+            for high in self.summary:
+                self.clusters[high] = None
+            self.summary = _node(
+                self.summary.universe_size, self._word_size,
+            )
+            self.min = self.max = self._counts = None
+            self.size = 0
+            return removed
+
+        shift = self._shift
+        mask = (1 << shift) - 1
+        lo_high, hi_high = lo >> shift, hi >> shift
+        clusters, summary = self.clusters, self._own_summary(owner)
+
+        if hi_high - lo_high > 1:
+            # whole clusters are dropped without looking inside, and the
+            # summary is fixed up for all of them at once
+            for high in summary.irange(lo_high + 1, hi_high - 1):
+                size = clusters[high].size
+                self._count(high, -size)
+                self.size -= size
+                clusters[high] = None
+            summary.discard_range(lo_high + 1, hi_high - 1, owner)
+        if lo_high == hi_high:
+            ends = [(lo_high, lo & mask, hi & mask)]
+        else:
+            ends = [(lo_high, lo & mask, mask), (hi_high, 0, hi & mask)]
+        for high, low, top in ends:
+            if clusters[high] is not None:
+                cluster = self._own_cluster(high, owner)
+                removed_here = cluster.discard_range(low, top, owner)
+                self._count(high, -removed_here)
+                self.size -= removed_here
+                if not cluster.size:
+                    clusters[high] = None
+                    summary.discard(high, owner)
+
+        if lo <= self.min:
+            # pull the smallest remaining clustered element up, as in discard
+            self.size -= 1
+            high = summary.min
+            cluster = self._own_cluster(high, owner)
+            low = cluster.min
+            self.min = (high << shift) | low
+            cluster.discard(low, owner)
+            self._count(high, -1)
+            if not cluster.size:
+                clusters[high] = None
+                summary.discard(high, owner)
+
+        high = summary.max
+        if high is None:
+            self.max = self.min
+        else:
+            self.max = (high << shift) | clusters[high].max
+        return removed - self.size
+
+    def rank(self, x):
+        """
+        How many elements are smaller than ``x``.
+        """
+        if self.min is None or x <= self.min:
+            return 0
+        elif x > self.max:
+            return self.size
+
+        shift = self._shift
+        high = x >> shift
+        clusters, summary = self.clusters, self.summary
+
+        if self._cluster_counts() is not None:
+            rank = 1 + self._count_before(high)
+        # otherwise add up whole clusters' sizes from whichever end has fewer
+        elif summary.rank(high) <= summary.size // 2:
+            rank = 1 + sum(
+                clusters[each].size for each in summary.irange(0, high - 1)
+            )
+        else:
+            rank = self.size - sum(
+                clusters[each].size
+                for each in summary.irange(high, summary.universe_size - 1)
+            )
+
+        cluster = clusters[high]
+        if cluster is not None:
+            rank += cluster.rank(x & ((1 << shift) - 1))
+        return rank
+
+    def select(self, k):
+        """
+        The ``k``-th smallest element, counting from 0.
+        """
+        if not k:
+            return self.min
+
+        shift, clusters = self._shift, self.clusters
+        # the minimum is outside of the clusters, so skip past it
+        k -= 1
+        counts = self._cluster_counts()
+        if counts is not None:
+            # descend the Fenwick tree to the cluster holding the k-th element
+            upper = self.summary.universe_size
+            high, step = 0, upper
+            while step:
+                i = high + step
+                if i <= upper and counts[i] <= k:
+                    high, k = i, k - counts[i]
+                step >>= 1
+            return (high << shift) | clusters[high].select(k)
+        elif k < (self.size - 1) // 2:
+            for high in self.summary:
+                cluster = clusters[high]
+                if k < cluster.size:
+                    return (high << shift) | cluster.select(k)
+                k -= cluster.size
+
+        k = self.size - 2 - k
+        for high in reversed(self.summary):
+            cluster = clusters[high]
+            if k < cluster.size:
+                return (high << shift) | cluster.select(cluster.size - 1 - k)
+            k -= cluster.size
+
+    def contains_many(self, xs):
+        """
+        Membership of each of the given sorted, distinct, in-range elements.
+        """
+        if self.min is None:
+            return [False] * len(xs)
+
+        found, clusters = [], self.clusters
+        for high, lows in _by_cluster(xs, self._shift):
+            cluster = clusters[high]
+            if cluster is None:
+                found.extend([False] * len(lows))
+            else:
+                found.extend(cluster.contains_many(lows))
+
+        i = bisect_left(xs, self.min)
+        if i != len(xs) and xs[i] == self.min:
+            found[i] = True
+        return found
+
+    def successor_many(self, xs):
+        """
+        The successor of each of the given sorted, distinct elements.
+        """
+        if self.min is None:
+            return [None] * len(xs)
+
+        minimum, maximum = self.min, self.max
+        start, stop = bisect_left(xs, minimum), bisect_left(xs, maximum)
+        found = [minimum] * start
+
+        shift, clusters, summary = self._shift, self.clusters, self.summary
+        for high, lows in _by_cluster(xs[:stop], shift, start):
+            cluster, base = clusters[high], high << shift
+            inside = 0
+            if cluster is not None:
+                inside = bisect_left(lows, cluster.max)
+                found.extend(
+                    base | low for low in cluster.successor_many(lows[:inside])
+                )
+            if inside < len(lows):
+                # everything else here shares one successor from a later
+                # cluster, which only needs finding once
+                following = summary.successor(high)
+                found.extend(
+                    [(following << shift) | clusters[following].min]
+                    * (len(lows) - inside),
+                )
+
+        found.extend([None] * (len(xs) - stop))
+        return found
+
+    def predecessor_many(self, xs):
+        """
+        The predecessor of each of the given sorted, distinct elements.
+        """
+        if self.min is None:
+            return [None] * len(xs)
+
+        minimum, maximum = self.min, self.max
+        start, stop = bisect_right(xs, minimum), bisect_right(xs, maximum)
+        found = [None] * start
+
+        shift, clusters, summary = self._shift, self.clusters, self.summary
+        for high, lows in _by_cluster(xs[:stop], shift, start):
+            cluster, base = clusters[high], high << shift
+            below = len(lows)
+            if cluster is not None:
+                below = bisect_right(lows, cluster.min)
+            if below:
+                # these all share one predecessor from an earlier cluster
+                preceding = summary.predecessor(high)
+                if preceding is None:
+                    value = minimum
+                else:
+                    value = (preceding << shift) | clusters[preceding].max
+                found.extend([value] * below)
+            if below < len(lows):
+                found.extend(
+                    base | low
+                    for low in cluster.predecessor_many(lows[below:])
+                )
+
+        found.extend([maximum] * (len(xs) - stop))
+        return found
+
+    def predecessor(self, x):
+        if self.min is None or x <= self.min:
+            return None
+        elif x > self.max:
+            return self.max
 
-        high, low = divmod(x, self._lower)
+        shift = self._shift
+        high, low = x >> shift, x & ((1 << shift) - 1)
         cluster = self.clusters[high]
 
-        if cluster is None:
+        if cluster is None or low <= cluster.min:
+            high = self.summary.predecessor(high)
+            if high is None:
+                return self.min
+            return (high << shift) | self.clusters[high].max
+        else:
+            return (high << shift) | cluster.predecessor(low)
+
+    def successor(self, x):
+        if self.min is None or x >= self.max:
+            return None
+        elif x < self.min:
+            return self.min
+
+        shift = self._shift
+        high, low = x >> shift, x & ((1 << shift) - 1)
+        cluster = self.clusters[high]
+
+        if cluster is None or low >= cluster.max:
+            high = self.summary.successor(high)
+            return (high << shift) | self.clusters[high].min
+        else:
+            return (high << shift) | cluster.successor(low)
+
+
+def _map_node(n, word_size):
+    """
+    A new empty `vEBDict` node for a universe of size ``n``.
+    """
+    if n <= word_size:
+        return _vEBMapLeaf(n)
+    return _vEBMapTree(n, word_size)
+
+
+def _wrapped(node, high, word_size):
+    """
+    A `vEBDict` node for the square of a node's universe, holding it whole.
+
+    The node becomes the new one's ``high``th cluster, once its minimum has
+    been lifted out (along with its value) to be the new one's.
+    """
+    n = node.universe_size
+    if n * n <= word_size:
+        return _vEBMapLeaf(n * n, node.bits << (high * n), node.values)
+    wrapped = _vEBMapTree(n * n, word_size)
+    wrapped.size = node.size
+    low, wrapped.min_value = node.min_item()
+    wrapped.min = wrapped.max = high * n + low
+    node.pop(low)
+    if node.size:
+        wrapped.clusters[high] = node
+        wrapped.summary.add(high)
+        wrapped.max = high * n + node.max
+    return wrapped
+
+
+class _vEBMapLeaf(_vEBLeaf):
+    """
+    A `vEBDict` leaf, whose values are kept in a list in order of their keys.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, n, bits=0, values=()):
+        _vEBLeaf.__init__(self, n, bits)
+        self.values = list(values)
+
+    def _index(self, x):
+        """
+        Where the value for ``x`` is (or belongs) in the list of values.
+        """
+        return bin(self.bits & ((1 << x) - 1)).count("1")
+
+    def items(self):
+        return zip(_ascending(self.bits), self.values)
+
+    def items_reversed(self):
+        return zip(_descending(self.bits), reversed(self.values))
+
+    def irange_items(self, lo, hi):
+        values = islice(self.values, self._index(lo), None)
+        return zip(self.irange(lo, hi), values)
+
+    def min_item(self):
+        return self.min, self.values[0]
+
+    def max_item(self):
+        return self.max, self.values[-1]
+
+    def get(self, x, default):
+        if (self.bits >> x) & 1:
+            return self.values[self._index(x)]
+        return default
+
+    def set(self, x, value):
+        """
+        Set the value for ``x``, returning whether it's a new key.
+        """
+        i = self._index(x)
+        if (self.bits >> x) & 1:
+            self.values[i] = value
+            return False
+        self.bits |= 1 << x
+        self.values.insert(i, value)
+        self.size += 1
+        return True
+
+    def pop(self, x):
+        """
+        Remove ``x``, returning its value (or `_MISSING` if it's not here).
+        """
+        if not (self.bits >> x) & 1:
+            return _MISSING
+        self.bits ^= 1 << x
+        self.size -= 1
+        return self.values.pop(self._index(x))
+
+    def predecessor_item(self, x):
+        x = self.predecessor(x)
+        return None if x is None else (x, self.values[self._index(x)])
+
+    def successor_item(self, x):
+        x = self.successor(x)
+        return None if x is None else (x, self.values[self._index(x)])
+
+
+class _vEBMapTree(_vEBTree):
+    """
+    An inner `vEBDict` node, whose minimum's value is kept alongside it.
+
+    The summary holds only keys, but the clusters are `vEBDict` nodes too, so
+    each value is in the same node as its key. When the minimum moves into
+    or out of the clusters, its value moves with it.
+    """
+
+    __slots__ = ("min_value",)
+
+    def __init__(self, n, word_size):
+        _vEBTree.__init__(self, n, word_size)
+        self.min_value = None
+
+    def items(self):
+        if self.min is None:
             return
-        cluster.discard(low)
+        yield self.min, self.min_value
 
-        if cluster.min is None:
+        shift, clusters = self._shift, self.clusters
+        for high in self.summary:
+            base = high << shift
+            for low, value in clusters[high].items():
+                yield base | low, value
+
+    def items_reversed(self):
+        if self.min is None:
+            return
+
+        shift, clusters = self._shift, self.clusters
+        for high in reversed(self.summary):
+            base = high << shift
+            for low, value in clusters[high].items_reversed():
+                yield base | low, value
+
+        yield self.min, self.min_value
+
+    def irange_items(self, lo, hi):
+        if self.min is None or lo > self.max or hi < self.min:
+            return
+        if lo <= self.min:
+            yield self.min, self.min_value
+
+        shift = self._shift
+        mask = (1 << shift) - 1
+        lo_high, hi_high = lo >> shift, hi >> shift
+        for high in self.summary.irange(lo_high, hi_high):
+            cluster, base = self.clusters[high], high << shift
+            low = lo & mask if high == lo_high else 0
+            top = hi & mask if high == hi_high else mask
+            for x, value in cluster.irange_items(low, top):
+                yield base | x, value
+
+    def min_item(self):
+        return self.min, self.min_value
+
+    def max_item(self):
+        high = self.summary.max
+        if high is None:
+            return self.min, self.min_value
+        low, value = self.clusters[high].max_item()
+        return (high << self._shift) | low, value
+
+    def get(self, x, default):
+        if self.min is None or x < self.min or x > self.max:
+            return default
+        elif x == self.min:
+            return self.min_value
+
+        shift = self._shift
+        cluster = self.clusters[x >> shift]
+        if cluster is None:
+            return default
+        return cluster.get(x & ((1 << shift) - 1), default)
+
+    def set(self, x, value):
+        """
+        Set the value for ``x``, returning whether it's a new key.
+        """
+        if self.min is None:
+            self.min = self.max = x
+            self.min_value = value
+            self.size = 1
+            return True
+
+        if x == self.min:
+            self.min_value = value
+            return False
+        elif x < self.min:
+            # the minimum is never stored in a cluster, so the old one (and
+            # its value) is what needs pushing down now
+            x, self.min = self.min, x
+            value, self.min_value = self.min_value, value
+
+        shift = self._shift
+        high = x >> shift
+        cluster = self.clusters[high]
+        if cluster is None:
+            cluster = self.clusters[high] = _map_node(
+                1 << shift, self._word_size,
+            )
+            self.summary.add(high)
+        if not cluster.set(x & ((1 << shift) - 1), value):
+            return False
+
+        self.max = max(self.max, x)
+        self.size += 1
+        return True
+
+    def pop(self, x):
+        """
+        Remove ``x``, returning its value (or `_MISSING` if it's not here).
+        """
+        if self.min is None or x < self.min or x > self.max:
+            return _MISSING
+
+        shift = self._shift
+        if x == self.min:
+            value = self.min_value
+            high = self.summary.min
+            if high is None:
+                self.min = self.max = self.min_value = None
+                self.size = 0
+                return value
+            # pull the smallest clustered item up to be the new minimum, and
+            # then remove it from its cluster below
+            cluster = self.clusters[high]
+            low, self.min_value = cluster.min_item()
+            x = self.min = (high << shift) | low
+            cluster.pop(low)
+        else:
+            high = x >> shift
+            cluster = self.clusters[high]
+            if cluster is None:
+                return _MISSING
+            value = cluster.pop(x & ((1 << shift) - 1))
+            if value is _MISSING:
+                return value
+
+        if not cluster.size:
             self.clusters[high] = None
             self.summary.discard(high)
+        self.size -= 1
 
         if x == self.max:
             global_max = self.summary.max
@@ -292,39 +3790,42 @@ class _vEBTree:
                 self.max = self.min
             else:
                 self.max = (
-                    global_max * self._lower + self.clusters[global_max].max
+                    (global_max << shift) | self.clusters[global_max].max
                 )
+        return value
 
-    def predecessor(self, x):
+    def predecessor_item(self, x):
         if self.min is None or x <= self.min:
             return None
         elif x > self.max:
-            return self.max
+            return self.max_item()
 
-        high, low = divmod(x, self._lower)
+        shift = self._shift
+        high, low = x >> shift, x & ((1 << shift) - 1)
         cluster = self.clusters[high]
 
         if cluster is None or low <= cluster.min:
             high = self.summary.predecessor(high)
             if high is None:
-                return self.min
-            return high * self._lower + self.clusters[high].max
+                return self.min, self.min_value
+            low, value = self.clusters[high].max_item()
         else:
-            low = cluster.predecessor(low)
-            return high * self._lower + low
+            low, value = cluster.predecessor_item(low)
+        return (high << shift) | low, value
 
-    def successor(self, x):
+    def successor_item(self, x):
         if self.min is None or x >= self.max:
             return None
         elif x < self.min:
-            return self.min
+            return self.min, self.min_value
 
-        high, low = divmod(x, self._lower)
+        shift = self._shift
+        high, low = x >> shift, x & ((1 << shift) - 1)
         cluster = self.clusters[high]
 
         if cluster is None or low >= cluster.max:
             high = self.summary.successor(high)
-            return high * self._lower + self.clusters[high].min
+            low, value = self.clusters[high].min_item()
         else:
-            low = cluster.successor(low)
-            return high * self._lower + low
+            low, value = cluster.successor_item(low)
+        return (high << shift) | low, value
@@ -1,8 +1,26 @@
-from unittest import TestCase, expectedFailure
+from unittest import TestCase, expectedFailure, mock, skipIf
 import bisect
+import copy
+import operator
+import pickle
 import random
+import sys
+import threading
 
-from veb import vEBTree
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from veb import (
+    ConcurrentvEBTree,
+    _core,
+    frozenvEBTree,
+    vEBDict,
+    vEBMultiset,
+    vEBTree,
+)
+from veb._core import WORD_SIZE
 
 
 class VEBTestMixin:
@@ -18,6 +36,27 @@ class VEBTestMixin:
         self.t.add(1)
         self.assertEqual(len(self.t), 2)
 
+    def test_len_after_discard(self):
+        self.t.update([0, 1])
+        self.t.add(1)
+        self.t.discard(0)
+        self.assertEqual(len(self.t), 1)
+
+        self.t.discard(0)
+        self.assertEqual(len(self.t), 1)
+
+        self.t.discard(1)
+        self.assertEqual(len(self.t), 0)
+
+    def test_add_reports_whether_added(self):
+        self.assertTrue(self.t.add(0))
+        self.assertFalse(self.t.add(0))
+
+    def test_discard_reports_whether_discarded(self):
+        self.t.add(0)
+        self.assertTrue(self.t.discard(0))
+        self.assertFalse(self.t.discard(0))
+
     def test_it_is_empty_when_created(self):
         for i in range(self.t.universe_size):
             self.assertNotIn(i, self.t)
@@ -30,6 +69,10 @@ class VEBTestMixin:
             self.t.add(i)
         self.assertEqual(list(self.t), list(evens))
 
+    def test_reversed_returns_contained_elements(self):
+        self.t.update([0, 1])
+        self.assertEqual(list(reversed(self.t)), [1, 0])
+
     def test_bool_returns_whether_empty(self):
         self.assertFalse(self.t)
         self.t.add(0)
@@ -118,6 +161,12 @@ class TestVEBTree(TestCase, VEBTestMixin):
         self.t.add(2)
         self.assertEqual(self.t.predecessor(3), 2)
 
+    def test_predecessor_of_a_huge_query(self):
+        t = vEBTree([1, 2, 3], word_size=self.t.word_size)
+        self.assertEqual(t.predecessor(1 << 100), 3)
+        d = vEBDict({1: "a", 2: "b"})
+        self.assertEqual(d.floor_key(1 << 100), 2)
+
     def test_predecessor_min_or_smaller(self):
         self.t.add(3)
         self.assertEqual(self.t.min, 3)
@@ -211,6 +260,143 @@ class TestVEBTree(TestCase, VEBTestMixin):
         t.grow(16)
         self.assertEqual(t.min, 2)
 
+    def test_grow_moves_old_root_into_a_cluster(self):
+        t = vEBTree(range(1, 256, 3), word_size=4)
+        old_root = t._root
+        t.grow(1 << 16)
+        self.assertIs(t._root.clusters[0], old_root)
+        self.assertEqual(list(t), list(range(1, 256, 3)))
+        self.assertEqual(len(t), len(range(1, 256, 3)))
+
+    def test_grow_moves_old_clusters(self):
+        t = vEBTree(range(0, 1 << 10, 5), word_size=4)
+        cluster = t._root.clusters[3]
+        t.grow(1 << 11)
+        self.assertIs(t._root.clusters[3], cluster)
+        self.assertEqual(list(t), list(range(0, 1 << 10, 5)))
+
+    def test_grow_from_odd_bits_keeps_aligned_clusters(self):
+        def clusters(node):
+            if node.__class__ is _core._vEBTree:
+                for high in node.summary:
+                    yield node.clusters[high]
+                    yield from clusters(node.clusters[high])
+
+        def ids(node):
+            return {id(each) for each in clusters(node)}
+
+        # 7 bits have clusters of 3 and then 1 bit, as do 12 bits' clusters
+        t = vEBTree(range(1 << 7), word_size=4)
+        old = ids(t._root)
+        t.grow(1 << 12)
+        self.assertEqual(t.universe_size, 1 << 12)
+        # all but the one emptied by lifting out the new second cluster's min
+        self.assertEqual(len(old - ids(t._root)), 1)
+        self.assertEqual(list(t), list(range(1 << 7)))
+
+        old = ids(t._root)
+        t.grow(1 << 13)
+        self.assertLessEqual(old, ids(t._root))
+        self.assertEqual(list(t), list(range(1 << 7)))
+
+    def test_grow_from_odd_bits_by_a_little_fits_the_universe(self):
+        # 8 bits have clusters of 4 and then 2, so no old node lines up, but
+        # rather than overshoot to 12 bits, the clusters are rebuilt
+        t = vEBTree(range(1 << 7), word_size=4)
+        t.grow(1 << 8)
+        self.assertEqual(t.universe_size, 1 << 8)
+        self.assertEqual(list(t), list(range(1 << 7)))
+
+    def test_growing_fits_the_universe_to_the_elements(self):
+        # (grown a chunk at a time by update)
+        elements = range(0, 1 << 20, 3)
+        t = vEBTree(elements)
+        self.assertEqual(
+            t.universe_size, vEBTree.from_sorted(elements).universe_size,
+        )
+
+        t = vEBTree(word_size=self.t.word_size)
+        for k in range(1, 41):
+            t.add(1 << k)
+            self.assertEqual(t.universe_size, 1 << (k + 1))
+
+    def test_grow_through_every_size(self):
+        t = vEBTree(word_size=self.t.word_size)
+        for i in range(1 << 10):
+            t.add(i)
+            self.assertGreater(t.universe_size, i)
+            self.assertLessEqual(t.universe_size, max(4, i * i))
+        self.assertEqual(list(t), list(range(1 << 10)))
+        self.assertEqual(list(reversed(t)), list(reversed(range(1 << 10))))
+        self.assertEqual(len(t), 1 << 10)
+
+    def test_shrink(self):
+        t = vEBTree(range(0, 300, 7), word_size=self.t.word_size)
+        t.update([5000, 70000])
+        t.discard(70000)
+        t.discard(5000)
+        self.assertEqual(t.universe_size, 1 << 17)
+
+        t.shrink()
+        self.assertEqual(t.universe_size, 512)
+        self.assertEqual(list(t), list(range(0, 300, 7)))
+        self.assertEqual(len(t), len(range(0, 300, 7)))
+
+        t.add(1000)
+        t.discard(0)
+        self.assertEqual(t.min, 7)
+        self.assertEqual(t.max, 1000)
+
+    def test_shrink_reuses_clusters(self):
+        t = vEBTree(range(1 << 10), word_size=4)
+        t.add(1 << 20)
+        cluster = t._root.clusters[0].clusters[1]
+        t.discard(1 << 20)
+        t.shrink()
+        self.assertEqual(t.universe_size, 1 << 10)
+        self.assertIs(_find(t._root, cluster), cluster)
+
+    def test_shrink_empty(self):
+        t = vEBTree([100], word_size=self.t.word_size)
+        t.discard(100)
+        t.shrink()
+        self.assertEqual(t.universe_size, 0)
+        self.assertEqual(list(t), [])
+        t.add(3)
+        self.assertEqual(list(t), [3])
+
+    def test_compact(self):
+        t = vEBTree(range(0, 5000, 3), word_size=self.t.word_size)
+        t.discard_range(100, 5000)
+        t.compact()
+        self.assertEqual(t.universe_size, 128)
+        self.assertEqual(list(t), list(range(0, 100, 3)))
+
+    def test_auto_shrink(self):
+        t = vEBTree(
+            [1, 2, 3, 1 << 16], word_size=self.t.word_size, auto_shrink=True,
+        )
+        self.assertTrue(t.discard(1 << 16))
+        self.assertEqual(t.universe_size, 4)
+        self.assertFalse(t.discard(1 << 16))
+
+        t.add(100)
+        t.add(200)
+        t.discard_range(101, 300)
+        self.assertLessEqual(t.universe_size, 256)
+        self.assertEqual(list(t), [1, 2, 3, 100])
+        t.discard(100)
+        self.assertEqual(t.universe_size, 4)
+
+    def test_auto_shrink_leaves_headroom(self):
+        t = vEBTree(
+            [1, 40, 50, 1000], word_size=self.t.word_size, auto_shrink=True,
+        )
+        t.discard(1000)
+        self.assertEqual(t.universe_size, 64)
+        t.discard(50)
+        self.assertEqual(t.universe_size, 64)
+
     def test_of_size(self):
         t = vEBTree.of_size(16)
         self.assertEqual(t.universe_size, 16)
@@ -228,6 +414,28 @@ class TestVEBTree(TestCase, VEBTestMixin):
         for x in e:
             self.assertIn(x, t)
 
+    def test_update_from_generator(self):
+        self.t.update(x for x in [5, 1, 3])
+        self.assertEqual(list(self.t), [1, 3, 5])
+        self.assertEqual(len(self.t), 3)
+
+    def test_update_in_chunks(self):
+        elements = random.sample(range(1 << 10), 200)
+        with mock.patch.object(_core, "_UPDATE_CHUNK", 7):
+            self.t.update(iter(elements))
+        self.assertEqual(list(self.t), sorted(elements))
+        self.assertEqual(len(self.t), len(elements))
+
+    def test_update_with_existing_and_smaller_elements(self):
+        t = vEBTree([50, 60, 70], word_size=self.t.word_size)
+        t.update([60, 10, 50, 65, 10])
+        self.assertEqual(list(t), [10, 50, 60, 65, 70])
+        self.assertEqual(len(t), 5)
+
+    def test_update_negative(self):
+        with self.assertRaises(ValueError):
+            self.t.update([2, -1])
+
     def test_init_adds_all_contents(self):
         t = vEBTree([1, 3, 15])
         self.assertEqual(t.universe_size, 16)
@@ -251,6 +459,876 @@ class TestVEBTree(TestCase, VEBTestMixin):
         self.t.update([3, 5, 7])
         self.assertEqual(t, self.t)
 
+    def test_equal_regardless_of_shape(self):
+        word_size = self.t.word_size
+        t = vEBTree([1, 2, 3], word_size=word_size)
+        grown = vEBTree([1, 2, 3, 1000], word_size=word_size)
+        grown.discard(1000)
+        self.assertEqual(t, grown)
+        self.assertEqual(
+            t, vEBTree([1, 2, 3], word_size=word_size, auto_rebase=True),
+        )
+        self.assertEqual(t, vEBTree([1, 2, 3], word_size=word_size * 2))
+        self.assertEqual(vEBTree(word_size=word_size), vEBTree.of_size(64))
+        self.assertNotEqual(t, vEBTree([1, 2, 4], word_size=word_size))
+
+    def test_from_sorted(self):
+        elements = sorted(random.sample(range(1 << 12), 500))
+        t = vEBTree.from_sorted(elements, word_size=self.t.word_size)
+        self.assertEqual(list(t), elements)
+        self.assertEqual(len(t), len(elements))
+
+        expected = vEBTree(elements, word_size=self.t.word_size)
+        self.assertEqual(t, expected)
+
+        for x in elements[::3]:
+            t.discard(x)
+            expected.discard(x)
+        t.update([1, 2, 4095])
+        expected.update([1, 2, 4095])
+        self.assertEqual(list(t), list(expected))
+        self.assertEqual(len(t), len(expected))
+
+    def test_from_sorted_ignores_duplicates(self):
+        t = vEBTree.from_sorted([1, 1, 2, 9, 9], word_size=self.t.word_size)
+        self.assertEqual(list(t), [1, 2, 9])
+        self.assertEqual(len(t), 3)
+
+    def test_from_sorted_empty(self):
+        t = vEBTree.from_sorted(iter([]), word_size=self.t.word_size)
+        self.assertEqual(t.universe_size, 0)
+        self.assertEqual(list(t), [])
+
+    def test_from_sorted_out_of_order(self):
+        with self.assertRaises(ValueError):
+            vEBTree.from_sorted([1, 3, 2])
+
+    def test_from_sorted_negative(self):
+        with self.assertRaises(ValueError):
+            vEBTree.from_sorted([-1, 3])
+
+    def test_set_operations(self):
+        word_size = self.t.word_size
+        ours = vEBTree([0, 1, 5, 9, 12, 40], word_size=word_size)
+        theirs = vEBTree([1, 9, 13, 40, 63], word_size=word_size)
+
+        for operation, expected in [
+            (ours | theirs, {0, 1, 5, 9, 12, 13, 40, 63}),
+            (ours & theirs, {1, 9, 40}),
+            (ours - theirs, {0, 5, 12}),
+            (theirs - ours, {13, 63}),
+            (ours ^ theirs, {0, 5, 12, 13, 63}),
+        ]:
+            self.assertIsInstance(operation, vEBTree)
+            self.assertEqual(list(operation), sorted(expected))
+            self.assertEqual(len(operation), len(expected))
+
+        self.assertEqual(list(ours), [0, 1, 5, 9, 12, 40])
+        self.assertEqual(list(theirs), [1, 9, 13, 40, 63])
+
+    def test_set_operations_with_different_universes(self):
+        small = vEBTree([1, 3], word_size=self.t.word_size)
+        big = vEBTree([3, 1000], word_size=self.t.word_size)
+        self.assertEqual(list(small | big), [1, 3, 1000])
+        self.assertEqual(list(small & big), [3])
+        self.assertEqual(list(big - small), [1000])
+        self.assertEqual(list(small ^ big), [1, 1000])
+
+    def test_set_operations_with_empty(self):
+        empty = vEBTree(word_size=self.t.word_size)
+        t = vEBTree([2, 4], word_size=self.t.word_size)
+        self.assertEqual(list(t | empty), [2, 4])
+        self.assertEqual(list(t & empty), [])
+        self.assertEqual(list(empty - t), [])
+        self.assertEqual(list(empty ^ t), [2, 4])
+
+    def test_set_operations_with_other_sets(self):
+        t = vEBTree([2, 4], word_size=self.t.word_size)
+        self.assertEqual(set(t | {5}), {2, 4, 5})
+        self.assertEqual(set({5, 4} | t), {2, 4, 5})
+        self.assertEqual(set({5, 4} - t), {5})
+
+    def test_in_place_set_operations(self):
+        word_size = self.t.word_size
+        t = vEBTree([1, 2, 3], word_size=word_size)
+        t |= vEBTree([3, 20], word_size=word_size)
+        self.assertEqual(list(t), [1, 2, 3, 20])
+        t &= vEBTree([2, 3, 20, 21], word_size=word_size)
+        self.assertEqual(list(t), [2, 3, 20])
+        t -= vEBTree([3], word_size=word_size)
+        self.assertEqual(list(t), [2, 20])
+        t ^= vEBTree([2, 7], word_size=word_size)
+        self.assertEqual(list(t), [7, 20])
+        self.assertEqual(len(t), 2)
+
+        t.add(100)
+        self.assertEqual(list(t), [7, 20, 100])
+
+    def test_in_place_set_operations_leave_other_clusters_alone(self):
+        t = vEBTree(range(0, 1 << 12, 3), word_size=self.t.word_size)
+        root = t._root
+        untouched = root.clusters[root.summary.max]
+        expected = set(t)
+        for other, operation in [
+            ({1, 2}, operator.ior),
+            (set(range(2, 1 << 12)), operator.iand),
+            ({3, 4}, operator.isub),
+            ({5, 6}, operator.ixor),
+        ]:
+            operation(t, vEBTree(other, word_size=self.t.word_size))
+            operation(expected, other)
+            self.assertIs(t._root, root)
+            self.assertIs(_find(root, untouched), untouched)
+            self.assertEqual(list(t), sorted(expected))
+
+    def test_in_place_set_operations_with_itself(self):
+        t = vEBTree(range(0, 1 << 10, 3), word_size=self.t.word_size)
+        t |= t
+        self.assertEqual(list(t), list(range(0, 1 << 10, 3)))
+        t ^= t
+        self.assertEqual(list(t), [])
+
+    def test_set_operations_share_clusters(self):
+        ours = vEBTree(range(0, 1 << 12, 3), word_size=self.t.word_size)
+        theirs = vEBTree([1, 2], word_size=self.t.word_size)
+        untouched = ours._root.clusters[ours._root.summary.max]
+        union = ours | theirs
+        self.assertIs(_find(union._root, untouched), untouched)
+
+        union.update(range(1, 1 << 12, 3))
+        ours.discard(3)
+        self.assertEqual(
+            (list(ours), list(theirs), list(union)),
+            (
+                [x for x in range(0, 1 << 12, 3) if x != 3],
+                [1, 2],
+                sorted({2, *range(0, 1 << 12, 3), *range(1, 1 << 12, 3)}),
+            ),
+        )
+
+    def test_issubset(self):
+        word_size = self.t.word_size
+        t = vEBTree([4, 8, 15, 16, 23, 42], word_size=word_size)
+        self.assertTrue(vEBTree([8, 42], word_size=word_size).issubset(t))
+        self.assertTrue(t.issubset(t))
+        self.assertTrue(vEBTree(word_size=word_size).issubset(t))
+        self.assertFalse(vEBTree([8, 43], word_size=word_size).issubset(t))
+        self.assertFalse(vEBTree([3, 8], word_size=word_size).issubset(t))
+        self.assertFalse(t.issubset(vEBTree([4, 42], word_size=word_size)))
+        self.assertTrue(t.issubset(range(50)))
+        self.assertTrue(t.issuperset([4, 16]))
+
+        self.assertLessEqual(vEBTree([16, 23], word_size=word_size), t)
+        self.assertLess(vEBTree([16, 23], word_size=word_size), t)
+        self.assertGreaterEqual(t, vEBTree([4, 8], word_size=word_size))
+        self.assertFalse(t < vEBTree(t, word_size=word_size))
+
+    def test_irange(self):
+        t = vEBTree([1, 4, 9, 16, 25, 36, 49], word_size=self.t.word_size)
+        self.assertEqual(list(t.irange(4, 36)), [4, 9, 16, 25, 36])
+        self.assertEqual(list(t.irange(5, 35)), [9, 16, 25])
+        self.assertEqual(list(t.irange(-10, 3)), [1])
+        self.assertEqual(list(t.irange(40, 1000)), [49])
+        self.assertEqual(list(t.irange(10, 15)), [])
+        self.assertEqual(list(t.irange(9, 4)), [])
+
+    def test_irange_reversed(self):
+        t = vEBTree([1, 4, 9, 16, 25, 36, 49], word_size=self.t.word_size)
+        self.assertEqual(
+            list(t.irange(1, 36, reverse=True)), [36, 25, 16, 9, 4, 1],
+        )
+        self.assertEqual(list(t.irange(2, 8, reverse=True)), [4])
+
+    def test_irange_is_lazy(self):
+        t = vEBTree(range(0, 100, 3), word_size=self.t.word_size)
+        elements = t.irange(10, 90)
+        self.assertEqual(next(elements), 12)
+        self.assertEqual(next(elements), 15)
+
+    def test_count_range(self):
+        t = vEBTree(range(0, 200, 5), word_size=self.t.word_size)
+        self.assertEqual(t.count_range(0, 199), 40)
+        self.assertEqual(t.count_range(5, 50), 10)
+        self.assertEqual(t.count_range(6, 9), 0)
+        self.assertEqual(t.count_range(-5, 0), 1)
+        self.assertEqual(t.count_range(50, 5), 0)
+
+    def test_discard_range(self):
+        t = vEBTree(range(0, 200, 5), word_size=self.t.word_size)
+        self.assertEqual(t.discard_range(12, 151), 28)
+        self.assertEqual(
+            list(t), [0, 5, 10, 155, 160, 165, 170, 175, 180, 185, 190, 195],
+        )
+        self.assertEqual(len(t), 12)
+
+        self.assertEqual(t.discard_range(0, 5), 2)
+        self.assertEqual(t.min, 10)
+        self.assertEqual(t.discard_range(180, 1000), 4)
+        self.assertEqual(t.max, 175)
+        self.assertEqual(t.discard_range(11, 154), 0)
+        self.assertEqual(list(t), [10, 155, 160, 165, 170, 175])
+
+        t.add(3)
+        self.assertEqual(list(t), [3, 10, 155, 160, 165, 170, 175])
+
+    def test_discard_range_everything(self):
+        t = vEBTree(range(0, 200, 5), word_size=self.t.word_size)
+        self.assertEqual(t.discard_range(0, 195), 40)
+        self.assertEqual(list(t), [])
+        self.assertIsNone(t.min)
+        self.assertIsNone(t.max)
+
+        t.update([4, 8])
+        self.assertEqual(list(t), [4, 8])
+
+    def test_rank(self):
+        t = vEBTree([3, 10, 11, 40, 63, 200], word_size=self.t.word_size)
+        self.assertEqual(
+            [t.rank(x) for x in [-1, 0, 3, 4, 11, 12, 63, 64, 200, 201, 999]],
+            [0, 0, 0, 1, 2, 3, 4, 5, 5, 6, 6],
+        )
+
+    def test_select(self):
+        elements = sorted(random.sample(range(1 << 10), 300))
+        t = vEBTree(elements, word_size=self.t.word_size)
+        self.assertEqual([t.select(k) for k in range(300)], elements)
+        self.assertEqual(t.select(-1), elements[-1])
+
+    def test_select_out_of_range(self):
+        t = vEBTree([1, 2], word_size=self.t.word_size)
+        with self.assertRaises(IndexError):
+            t.select(2)
+        with self.assertRaises(IndexError):
+            t.select(-3)
+
+    def test_indexing(self):
+        t = vEBTree([5, 17, 2, 99], word_size=self.t.word_size)
+        self.assertEqual((t[0], t[1], t[3], t[-1], t[-4]), (2, 5, 99, 99, 2))
+        with self.assertRaises(IndexError):
+            t[4]
+
+    def test_rank_and_select_after_discarding(self):
+        t = vEBTree(range(100), word_size=self.t.word_size)
+        t.discard_range(10, 19)
+        t.discard(0)
+        self.assertEqual(t.rank(50), 39)
+        self.assertEqual(t[9], 20)
+        self.assertEqual(t[0], 1)
+
+    def test_rank_and_select_across_many_clusters(self):
+        elements = set(random.sample(range(1 << 20), 2000))
+        t = vEBTree(elements, word_size=self.t.word_size)
+        self.assertEqual(t.rank(1 << 19), sum(x < 1 << 19 for x in elements))
+
+        for x in random.sample(range(1 << 20), 200):
+            t.add(x)
+            elements.add(x)
+        for x in random.sample(sorted(elements), 200):
+            t.discard(x)
+            elements.discard(x)
+        added = random.sample(range(1 << 20), 100)
+        t.update(added)
+        elements.update(added)
+        t.discard_range(1 << 18, 1 << 19)
+        elements = sorted(x for x in elements if not 1 << 18 <= x <= 1 << 19)
+
+        for k in range(0, len(elements), 37):
+            self.assertEqual(t.select(k), elements[k])
+            self.assertEqual(t.rank(elements[k]), k)
+        self.assertEqual(
+            t.count_range(1000, 1 << 19),
+            bisect.bisect_right(elements, 1 << 19)
+            - bisect.bisect_left(elements, 1000),
+        )
+
+    def test_iter_and_reversed(self):
+        elements = sorted(random.sample(range(1 << 12), 700))
+        t = vEBTree(elements, word_size=self.t.word_size)
+        for x in elements[::5]:
+            t.discard(x)
+        del elements[::5]
+        self.assertEqual(list(t), elements)
+        self.assertEqual(list(reversed(t)), elements[::-1])
+
+    def test_bytes_roundtrip_sparse(self):
+        t = vEBTree(
+            random.sample(range(1 << 30), 100), word_size=self.t.word_size,
+        )
+        loaded = vEBTree.from_bytes(t.to_bytes())
+        self.assertEqual(loaded, t)
+        self.assertEqual(loaded.word_size, t.word_size)
+
+    def test_bytes_roundtrip_dense(self):
+        t = vEBTree(
+            random.sample(range(1 << 12), 3000), word_size=self.t.word_size,
+        )
+        data = t.to_bytes()
+        self.assertLess(len(data), 600)
+        self.assertEqual(vEBTree.from_bytes(data), t)
+
+    def test_bytes_roundtrip_keeps_universe(self):
+        t = vEBTree.of_size(1 << 10, word_size=self.t.word_size)
+        t.add(3)
+        loaded = vEBTree.from_bytes(t.to_bytes())
+        self.assertEqual(loaded.universe_size, 1 << 10)
+        loaded.add(1000)
+        self.assertEqual(list(loaded), [3, 1000])
+
+    def test_from_bytes_invalid(self):
+        with self.assertRaises(ValueError):
+            vEBTree.from_bytes(b"nope")
+        with self.assertRaises(ValueError):
+            vEBTree.from_bytes(vEBTree([1, 2, 300]).to_bytes()[:-1])
+
+    def test_from_bytes_truncated_after_the_count(self):
+        data = vEBTree([1, 2]).to_bytes()
+        with self.assertRaises(ValueError):
+            vEBTree.from_bytes(data[:8])
+
+    def test_from_bytes_universe_not_a_power_of_2(self):
+        # the universe size is the varint just before the count of 2
+        data = bytearray(vEBTree([1, 2]).to_bytes())
+        self.assertEqual(data[7:9], b"\x04\x02")
+        data[7] = 3
+        with self.assertRaises(ValueError):
+            vEBTree.from_bytes(bytes(data))
+
+    def test_from_bytes_unknown_flags(self):
+        # the flags are the varint just before the universe size of 4
+        data = bytearray(vEBTree([1, 2]).to_bytes())
+        self.assertEqual(data[6:8], b"\x00\x04")
+        data[6] = 4
+        with self.assertRaises(ValueError):
+            vEBTree.from_bytes(bytes(data))
+
+    def test_from_bytes_trailing_bytes(self):
+        # one stored as deltas, and one as a bitmap
+        for t in vEBTree([1, 2, 300]), vEBTree(range(0, 300, 2)):
+            data = t.to_bytes()
+            self.assertEqual(vEBTree.from_bytes(data), t)
+            with self.assertRaises(ValueError):
+                vEBTree.from_bytes(data + b"\x00")
+
+    def test_array_support_without_numpy(self):
+        no_numpy = mock.patch.dict(sys.modules, {"numpy": None})
+        with no_numpy, self.assertRaises(ImportError):
+            vEBTree([1, 2]).to_array()
+
+    def test_pickle(self):
+        t = vEBTree([0, 7, 300, 4096], word_size=self.t.word_size)
+        self.assertEqual(pickle.loads(pickle.dumps(t)), t)  # noqa: S301
+
+    def test_pickle_keeps_flags(self):
+        t = vEBTree(
+            [10, 20],
+            word_size=self.t.word_size,
+            auto_shrink=True,
+            auto_rebase=True,
+        )
+        for loaded in (
+            pickle.loads(pickle.dumps(t)),  # noqa: S301
+            copy.deepcopy(t),
+        ):
+            self.assertTrue(loaded.auto_shrink)
+            self.assertTrue(loaded.auto_rebase)
+            loaded.add(-5)
+            self.assertEqual(list(loaded), [-5, 10, 20])
+
+    def test_base(self):
+        base = 1_700_000_000_000
+        t = vEBTree(
+            [base + 5, base + 1], word_size=self.t.word_size, base=base,
+        )
+        self.assertEqual(t.universe_size, 8)
+        self.assertEqual((t.min, t.max, len(t)), (base + 1, base + 5, 2))
+        self.assertEqual(list(t), [base + 1, base + 5])
+        self.assertEqual(list(reversed(t)), [base + 5, base + 1])
+        self.assertIn(base + 5, t)
+        self.assertNotIn(5, t)
+        self.assertEqual(t.successor(base + 1), base + 5)
+        self.assertEqual(t.predecessor(base + 5), base + 1)
+        self.assertEqual(t.successor(0), base + 1)
+        self.assertEqual(list(t.irange(0, base + 3)), [base + 1])
+        self.assertEqual((t.rank(base + 5), t.select(1)), (1, base + 5))
+        self.assertTrue(t.discard(base + 1))
+        self.assertEqual(list(t), [base + 5])
+
+    def test_below_base(self):
+        t = vEBTree([10, 12], word_size=self.t.word_size, base=10)
+        with self.assertRaises(ValueError):
+            t.add(9)
+        with self.assertRaises(ValueError):
+            t.update([11, 3])
+        with self.assertRaises(ValueError):
+            t |= vEBTree([3])
+        self.assertEqual(list(t), [10, 12])
+        self.assertFalse(t.discard(9))
+
+    def test_negative_elements_without_a_base(self):
+        with self.assertRaises(ValueError):
+            vEBTree(word_size=self.t.word_size).add(-1)
+
+    def test_negative_base(self):
+        t = vEBTree([-5, -1, 3], word_size=self.t.word_size, base=-8)
+        self.assertEqual(list(t), [-5, -1, 3])
+        self.assertEqual(t.successor(-5), -1)
+        self.assertEqual(t.universe_size, 16)
+
+    def test_auto_rebase(self):
+        t = vEBTree(word_size=self.t.word_size, auto_rebase=True)
+        t.add(1_700_000_000_000)
+        self.assertEqual(t.base, 1_700_000_000_000)
+        t.update([1_700_000_000_007, 1_699_999_999_990])
+        self.assertEqual(
+            list(t),
+            [1_699_999_999_990, 1_700_000_000_000, 1_700_000_000_007],
+        )
+        self.assertLessEqual(t.base, 1_699_999_999_990)
+        self.assertLess(t.universe_size, 64)
+
+    def test_auto_rebase_negative(self):
+        t = vEBTree(
+            [3, -7, 1 << 12], word_size=self.t.word_size, auto_rebase=True,
+        )
+        t.add(-(1 << 12))
+        self.assertEqual(list(t), [-(1 << 12), -7, 3, 1 << 12])
+        self.assertEqual(t.predecessor(-6), -7)
+        self.assertEqual(t.successor(4), 1 << 12)
+
+    def test_auto_rebase_reuses_old_clusters(self):
+        t = vEBTree(range(1 << 8, 1 << 9), word_size=4, auto_rebase=True)
+        cluster = t._root.clusters[t._root.summary.max]
+        t.add(0)
+        self.assertEqual(t.base, 0)
+        self.assertIs(_find(t._root, cluster), cluster)
+
+    def test_shrink_rebases(self):
+        t = vEBTree(
+            [0, 1 << 20, (1 << 20) + 3],
+            word_size=self.t.word_size,
+            auto_rebase=True,
+        )
+        t.discard(0)
+        t.shrink()
+        self.assertEqual(list(t), [1 << 20, (1 << 20) + 3])
+        self.assertEqual(t.base, 1 << 20)
+        self.assertEqual(t.universe_size, 4)
+
+    def test_compact_rebases(self):
+        t = vEBTree(
+            [0, 1000, 1002], word_size=self.t.word_size, auto_rebase=True,
+        )
+        t.discard(0)
+        t.compact()
+        self.assertEqual((t.base, t.universe_size), (1000, 4))
+        self.assertEqual(list(t), [1000, 1002])
+
+    def test_auto_shrink_rebases(self):
+        t = vEBTree(
+            range(1 << 12),
+            word_size=self.t.word_size,
+            auto_shrink=True,
+            auto_rebase=True,
+        )
+        t.discard_range(0, (1 << 12) - 3)
+        self.assertEqual(list(t), [(1 << 12) - 2, (1 << 12) - 1])
+        self.assertLess(t.universe_size, 1 << 10)
+
+    def test_set_operations_with_different_bases(self):
+        t = vEBTree([-3, 5, 1 << 20], word_size=self.t.word_size, base=-8)
+        other = vEBTree([5, 9], word_size=self.t.word_size, base=4)
+        self.assertEqual(list(t | other), [-3, 5, 9, 1 << 20])
+        self.assertEqual(list(t & other), [5])
+        self.assertEqual(list(t - other), [-3, 1 << 20])
+        self.assertEqual(list(other - t), [9])
+        self.assertEqual(list(t ^ other), [-3, 9, 1 << 20])
+        self.assertTrue(vEBTree([5], base=5) <= t)
+        self.assertFalse(t <= other)
+
+    def test_set_operations_with_other_sets_keep_the_base(self):
+        t = vEBTree([-5, 3], word_size=self.t.word_size, base=-10)
+        for result, expected in [
+            (t & {-5}, [-5]),
+            (t | {1}, [-5, 1, 3]),
+            (t - {3}, [-5]),
+            ({-5, 7} - t, [7]),
+        ]:
+            self.assertEqual((list(result), result.base), (expected, -10))
+            self.assertEqual(result.word_size, self.t.word_size)
+
+    def test_issubset_of_other_sets_below_the_base(self):
+        self.assertTrue(vEBTree([1]).issubset({-1, 1}))
+        self.assertFalse(vEBTree([1]).issuperset([-1]))
+        self.assertTrue(vEBTree([-1, 1], auto_rebase=True).issuperset([-1]))
+
+    def test_in_place_set_operations_with_a_fixed_base(self):
+        t = vEBTree([10, 12], word_size=self.t.word_size, base=10)
+        t &= vEBTree([3, 12], word_size=self.t.word_size)
+        self.assertEqual((list(t), t.base), ([12], 10))
+        t -= vEBTree([3])
+        t |= vEBTree([11])
+        self.assertEqual((list(t), t.base), ([11, 12], 10))
+
+    def test_from_sorted_with_base(self):
+        t = vEBTree.from_sorted(
+            [-3, 4, 9], word_size=self.t.word_size, base=-4,
+        )
+        self.assertEqual((list(t), t.base), ([-3, 4, 9], -4))
+        with self.assertRaises(ValueError):
+            vEBTree.from_sorted([-5, 4], base=-4)
+
+    def test_bytes_roundtrip_keeps_base(self):
+        for base in -(1 << 40), 1 << 40:
+            t = vEBTree(
+                [base + 3, base + 100], word_size=self.t.word_size, base=base,
+            )
+            loaded = vEBTree.from_bytes(t.to_bytes())
+            self.assertEqual(loaded, t)
+            self.assertEqual(loaded.base, base)
+
+    def test_from_bytes_version_1(self):
+        t = vEBTree.from_bytes(b"vEB\x01\x40\x04\x02\x00\x02\x02")
+        self.assertEqual((list(t), t.universe_size), ([1, 3], 4))
+
+    def test_snapshot_keeps_base(self):
+        t = vEBTree([100, 103], word_size=self.t.word_size, auto_rebase=True)
+        snapshot = t.snapshot()
+        t.add(3)
+        self.assertEqual(list(snapshot), [100, 103])
+        self.assertEqual(snapshot.base, 100)
+
+    def test_pop_min_and_max(self):
+        t = vEBTree([1, 5, 300, 4096], word_size=self.t.word_size)
+        self.assertEqual((t.pop_min(), t.pop_max()), (1, 4096))
+        self.assertEqual((t.pop_min(), t.pop_max()), (5, 300))
+        self.assertFalse(t)
+        with self.assertRaises(KeyError):
+            t.pop_min()
+        with self.assertRaises(KeyError):
+            t.pop_max()
+
+    def test_pop_min_auto_shrink(self):
+        t = vEBTree([1 << 12, 1], word_size=self.t.word_size, auto_shrink=True)
+        t.pop_max()
+        self.assertEqual(t.universe_size, 2)
+
+    def test_push_and_peek(self):
+        t = vEBTree(word_size=self.t.word_size)
+        with self.assertRaises(KeyError):
+            t.peek_min()
+        with self.assertRaises(KeyError):
+            t.peek_max()
+        self.assertTrue(t.push(30))
+        self.assertFalse(t.push(30))
+        t.push(4)
+        self.assertEqual((t.peek_min(), t.peek_max()), (4, 30))
+        self.assertEqual(len(t), 2)
+
+    def test_as_a_priority_queue(self):
+        priorities = random.sample(range(1 << 16), 500)
+        t = vEBTree(word_size=self.t.word_size)
+        for each in priorities:
+            t.push(each)
+        drained = [t.pop_min() for _ in priorities]
+        self.assertEqual(drained, sorted(priorities))
+
+    def test_popn_min(self):
+        t = vEBTree([1, 5, 300, 4096], word_size=self.t.word_size)
+        self.assertEqual(t.popn_min(3), [1, 5, 300])
+        self.assertEqual(t.popn_min(3), [4096])
+        self.assertEqual(t.popn_min(3), [])
+        self.assertEqual(t.universe_size, 1 << 13)
+
+    def test_cursor(self):
+        elements = [1, 5, 6, 7, 300, 301, 4096]
+        t = vEBTree(elements, word_size=self.t.word_size)
+        cursor = t.cursor(0)
+        self.assertEqual(cursor.peek(), 1)
+        walked = [cursor.peek()]
+        while cursor.next() is not None:
+            walked.append(cursor.peek())
+        self.assertEqual(walked, elements)
+        self.assertIsNone(cursor.next())
+        self.assertEqual(cursor.peek(), 4096)
+
+        walked = [cursor.peek()]
+        while cursor.prev() is not None:
+            walked.append(cursor.peek())
+        self.assertEqual(walked, elements[::-1])
+
+    def test_cursor_seek(self):
+        t = vEBTree([1, 5, 300, 4096], word_size=self.t.word_size)
+        cursor = t.cursor(6)
+        self.assertEqual(cursor.peek(), 300)
+        self.assertEqual(cursor.seek(5), 5)
+        self.assertEqual(cursor.seek(4096), 4096)
+        self.assertEqual(cursor.seek(2), 5)
+        self.assertEqual(cursor.prev(), 1)
+
+    def test_cursor_past_the_end(self):
+        t = vEBTree([1, 5], word_size=self.t.word_size)
+        cursor = t.cursor(6)
+        self.assertIsNone(cursor.peek())
+        self.assertEqual(cursor.position, 6)
+        self.assertIsNone(cursor.next())
+        self.assertEqual(cursor.prev(), 5)
+
+    def test_cursor_with_a_base(self):
+        t = vEBTree([1000, 1005], word_size=self.t.word_size, base=1000)
+        cursor = t.cursor(900)
+        self.assertEqual((cursor.peek(), cursor.next()), (1000, 1005))
+        self.assertEqual(cursor.prev(), 1000)
+        self.assertIsNone(cursor.prev())
+
+    def test_cursor_sees_modifications(self):
+        t = vEBTree(range(0, 1 << 12, 4), word_size=self.t.word_size)
+        cursor = t.cursor(100)
+        t.discard(100)
+        self.assertIsNone(cursor.peek())
+        t.add(101)
+        self.assertEqual(cursor.next(), 101)
+        t.discard_range(0, 200)
+        t.add(3)
+        self.assertEqual(cursor.prev(), 3)
+        t.add(1 << 20)
+        self.assertEqual(cursor.seek(1 << 13), 1 << 20)
+
+    def test_cursor_sees_copies_made_for_a_snapshot(self):
+        t = vEBTree(range(0, 1 << 12, 4), word_size=self.t.word_size)
+        cursor = t.cursor(100)
+        snapshot = t.snapshot()
+        t.add(101)
+        t.discard(104)
+        self.assertEqual((cursor.next(), cursor.next()), (101, 108))
+        self.assertIn(104, snapshot)
+
+    def test_cursor_matches_successor_and_predecessor(self):
+        elements = random.sample(range(1 << 16), 500)
+        t = vEBTree(elements, word_size=self.t.word_size)
+        cursor = t.cursor(0)
+        for _ in range(1000):
+            position = cursor.position
+            if random.random() < 0.5:
+                self.assertEqual(cursor.next(), t.successor(position))
+            else:
+                self.assertEqual(cursor.prev(), t.predecessor(position))
+
+    def test_snapshot(self):
+        t = vEBTree([1, 5, 300, 4096], word_size=self.t.word_size)
+        snapshot = t.snapshot()
+        t.add(7)
+        t.discard(300)
+        snapshot.add(9000)
+        self.assertEqual(list(t), [1, 5, 7, 4096])
+        self.assertEqual(list(snapshot), [1, 5, 300, 4096, 9000])
+
+    def test_snapshot_of_snapshot(self):
+        t = vEBTree([1, 5, 300], word_size=self.t.word_size)
+        first = t.snapshot()
+        second = first.snapshot()
+        first.discard(5)
+        second.discard_range(0, 299)
+        t.update([2, 3])
+        self.assertEqual(
+            (list(t), list(first), list(second)),
+            ([1, 2, 3, 5, 300], [1, 300], [300]),
+        )
+
+    def test_snapshot_copies_only_the_modified_path(self):
+        t = vEBTree(range(0, 1 << 12, 2), word_size=self.t.word_size)
+        snapshot = t.snapshot()
+        untouched = t._root.clusters[t._root.summary.max]
+        t.add(3)
+        self.assertIsNot(t._root, snapshot._root)
+        self.assertIs(_find(t._root, untouched), untouched)
+        self.assertEqual(len(t), len(snapshot) + 1)
+
+    def test_snapshot_survives_grow_and_shrink(self):
+        t = vEBTree([1, 5, 300], word_size=self.t.word_size)
+        snapshot = t.snapshot()
+        t.add(1 << 20)
+        t.discard(1 << 20)
+        t.shrink()
+        t.discard(5)
+        self.assertEqual(list(snapshot), [1, 5, 300])
+        self.assertEqual(snapshot.universe_size, 512)
+
+    def test_snapshot_auto_shrink(self):
+        t = vEBTree(
+            [1, 5, 1 << 12], word_size=self.t.word_size, auto_shrink=True,
+        )
+        snapshot = t.snapshot()
+        snapshot.discard(1 << 12)
+        self.assertEqual(list(t), [1, 5, 1 << 12])
+        self.assertLess(snapshot.universe_size, t.universe_size)
+
+    def test_small_trees_keep_a_sorted_list(self):
+        big = 1 << 40
+        t = vEBTree([5, big, 1], word_size=self.t.word_size)
+        self.assertEqual(t.stats()["depth"], 1)
+        self.assertEqual(list(t), [1, 5, big])
+        self.assertEqual((t.successor(1), t.predecessor(big)), (5, 5))
+        self.assertEqual((t.rank(6), t[1], t.count_range(2, big)), (2, 5, 2))
+        self.assertEqual(list(t.irange(2, 2 * big, reverse=True)), [big, 5])
+        t.discard(5)
+        self.assertEqual(list(t), [1, 1 << 40])
+
+    def test_small_trees_are_promoted_when_they_grow(self):
+        limit = _core._MAX_SORTED
+        t = vEBTree(range(0, 2 * limit, 2), word_size=self.t.word_size)
+        small = t.stats()
+        t.add(2 * limit)
+        self.assertGreater(t.stats()["depth"], small["depth"])
+        self.assertEqual(list(t), list(range(0, 2 * limit + 1, 2)))
+
+        t = vEBTree(word_size=self.t.word_size)
+        t.update(range(limit + 1))
+        self.assertGreater(t.stats()["depth"], 1)
+        self.assertEqual(list(t), list(range(limit + 1)))
+
+    def test_shrink_demotes_to_a_sorted_list(self):
+        t = vEBTree(range(1 << 10), word_size=self.t.word_size)
+        t.discard_range(3, (1 << 10) - 2)
+        t.shrink()
+        self.assertEqual(t.stats()["depth"], 1)
+        self.assertEqual(list(t), [0, 1, 2, (1 << 10) - 1])
+
+    def test_discarding_demotes_to_a_sorted_list(self):
+        limit = _core._MAX_SORTED
+        t = vEBTree(range(1 << 10), word_size=self.t.word_size)
+        t.discard_range(limit, (1 << 10) - 2)
+        self.assertGreater(t.stats()["depth"], 1)
+        for x in range(0, limit + 1, 2):
+            t.discard(x)
+        self.assertGreater(t.stats()["depth"], 1)
+        t.discard(1)
+        self.assertEqual(t.stats()["depth"], 1)
+        self.assertEqual(t.universe_size, 1 << 10)
+        self.assertEqual(list(t), [*range(3, limit, 2), (1 << 10) - 1])
+
+        t = vEBTree(range(1 << 10), word_size=self.t.word_size)
+        t.discard_range(3, (1 << 10) - 2)
+        self.assertEqual(t.stats()["depth"], 1)
+        self.assertEqual(list(t), [0, 1, 2, (1 << 10) - 1])
+
+    def test_auto_shrink_demotes_to_a_sorted_list(self):
+        t = vEBTree(
+            range(1 << 10), word_size=self.t.word_size, auto_shrink=True,
+        )
+        for x in range(1, 1 << 10, 2):
+            t.discard(x)
+        self.assertGreater(t.stats()["depth"], 1)
+        t.discard_range(1 << 5, (1 << 10) - 3)
+        self.assertEqual(t.stats()["depth"], 1)
+        self.assertEqual(t.universe_size, 1 << 10)
+        self.assertEqual(list(t), [*range(0, 1 << 5, 2), (1 << 10) - 2])
+
+    def test_sorted_and_clustered_trees_compare_equal(self):
+        elements = [*range(40), 255]
+        clustered = vEBTree(range(1 << 8), word_size=self.t.word_size)
+        clustered.discard_range(40, (1 << 8) - 2)
+        self.assertGreater(clustered.stats()["depth"], 1)
+        small = vEBTree(elements, word_size=self.t.word_size)
+        small.grow(1 << 8)
+        self.assertEqual(small.stats()["depth"], 1)
+        self.assertEqual(clustered, small)
+        self.assertEqual(list(clustered | small), elements)
+        self.assertTrue(small.issubset(clustered))
+
+    def test_snapshot_of_a_small_tree(self):
+        t = vEBTree([1, 5, 1 << 20], word_size=self.t.word_size)
+        snapshot = t.snapshot()
+        t.add(7)
+        t.update(range(100, 100 + _core._MAX_SORTED))
+        snapshot.discard(5)
+        self.assertEqual(list(snapshot), [1, 1 << 20])
+        self.assertEqual(len(t), 4 + _core._MAX_SORTED)
+
+    def test_copy(self):
+        t = vEBTree([1, 5, 300], word_size=self.t.word_size)
+        for copied in t.copy(), copy.copy(t):
+            copied.add(2)
+            self.assertEqual(list(t), [1, 5, 300])
+            self.assertEqual(list(copied), [1, 2, 5, 300])
+
+    def test_stats(self):
+        t = vEBTree(range(0, 1 << 12, 3), word_size=self.t.word_size)
+        stats = t.stats()
+        self.assertEqual(stats["elements"], len(t))
+        self.assertEqual(stats["universe_size"], 1 << 12)
+        self.assertGreater(stats["depth"], 1)
+        self.assertGreater(stats["leaves"], 0)
+        self.assertGreaterEqual(
+            stats["cluster_slots"], stats["occupied_cluster_slots"],
+        )
+        self.assertLess(stats["summary_bytes"], stats["bytes"])
+
+    def test_stats_shows_emptied_clusters(self):
+        t = vEBTree(range(1 << 12), word_size=self.t.word_size)
+        before = t.stats()
+        # (leaving enough that the root stays clustered)
+        t.discard_range(1, (1 << 12) - 100)
+        after = t.stats()
+        self.assertGreater(
+            after["cluster_slots"], after["occupied_cluster_slots"],
+        )
+        self.assertLess(
+            after["occupied_cluster_slots"], before["occupied_cluster_slots"],
+        )
+        self.assertLess(after["bytes"], before["bytes"])
+
+    def test_sizeof(self):
+        small = vEBTree([1], word_size=self.t.word_size)
+        big = vEBTree(range(1 << 12), word_size=self.t.word_size)
+        self.assertGreater(sys.getsizeof(big), big.stats()["bytes"])
+        self.assertGreater(sys.getsizeof(big), sys.getsizeof(small))
+
+    def test_word_size_must_be_a_power_of_two(self):
+        with self.assertRaises(ValueError):
+            vEBTree(word_size=3)
+        with self.assertRaises(ValueError):
+            vEBTree(word_size=1)
+
+
+def _find(node, target):
+    """
+    Find a node (by identity) somewhere within the given one.
+    """
+    if node is target:
+        return node
+    for high in getattr(node, "summary", ()):
+        found = _find(node.clusters[high], target)
+        if found is not None:
+            return found
+    return None
+
+
+class TestSmallWordVEBTree(TestVEBTree):
+    """
+    The same tests, but with leaves small enough to exercise inner nodes.
+    """
+
+    def setUp(self):
+        self.t = vEBTree.of_size(4, word_size=2)
+
+    def test_leaf_sized_universe(self):
+        t = vEBTree.of_size(16, word_size=16)
+        t.update([0, 5, 15])
+        self.assertEqual(list(t), [0, 5, 15])
+        self.assertEqual(list(reversed(t._root)), [15, 5, 0])
+        self.assertEqual(t.successor(5), 15)
+        self.assertEqual(t.predecessor(5), 0)
+        self.assertIsNone(t.successor(15))
+        self.assertIsNone(t.predecessor(0))
+
+    def test_inner_nodes_are_not_public_trees(self):
+        t = vEBTree(range(128), word_size=2)
+        root = t._root
+        self.assertNotIsInstance(root.summary, vEBTree)
+        self.assertNotIsInstance(root.clusters[0], vEBTree)
+        self.assertFalse(hasattr(root, "__dict__"))
+        self.assertFalse(hasattr(root.clusters[0], "__dict__"))
+
 
 class TestSize2VEBTree(TestCase, VEBTestMixin):
     def setUp(self):
@@ -326,6 +1404,9 @@ class TestEmptyVEBTree(TestCase, VEBTestMixin):
     def test_iter(self):
         self.assertEqual(list(self.t), [])
 
+    def test_reversed(self):
+        self.assertEqual(list(reversed(self.t)), [])
+
     def test_len(self):
         self.assertEqual(len(self.t), 0)
 
@@ -341,11 +1422,573 @@ class TestEmptyVEBTree(TestCase, VEBTestMixin):
     def test_successor(self):
         self.assertIsNone(self.t.successor(0))
 
+    def test_irange(self):
+        self.assertEqual(list(self.t.irange(0, 10)), [])
+
+    def test_count_range(self):
+        self.assertEqual(self.t.count_range(0, 10), 0)
+
+    def test_discard_range(self):
+        self.assertEqual(self.t.discard_range(0, 10), 0)
+
+    def test_rank(self):
+        self.assertEqual(self.t.rank(10), 0)
+
+    def test_select(self):
+        with self.assertRaises(IndexError):
+            self.t.select(0)
+
+    def test_bytes_roundtrip(self):
+        self.assertEqual(vEBTree.from_bytes(self.t.to_bytes()), self.t)
+
+    def test_stats(self):
+        stats = self.t.stats()
+        self.assertEqual(stats["depth"], 0)
+        self.assertEqual(stats["bytes"], 0)
+
     def test_grow(self):
         self.t.grow(2)
         self.assertEqual(self.t.universe_size, 2)
 
 
+class TestHugeUniverse(TestCase):
+    def setUp(self):
+        self.elements = sorted(random.getrandbits(64) for _ in range(200))
+        self.t = vEBTree(self.elements)
+
+    def test_universe(self):
+        self.assertEqual(self.t.universe_size, 1 << 64)
+
+    def test_clusters_are_only_allocated_when_used(self):
+        clusters = self.t._root.clusters
+        self.assertLessEqual(len(clusters), len(self.elements))
+        self.assertIsNone(clusters[next(
+            high for high in range(1 << 32) if high not in clusters
+        )])
+
+    def test_contents(self):
+        self.assertEqual(list(self.t), self.elements)
+        self.assertEqual(len(self.t), len(self.elements))
+        for x in self.elements:
+            self.assertIn(x, self.t)
+            self.assertNotIn(x + 1, self.t)
+
+    def test_successor_predecessor(self):
+        for x, y in zip(self.elements, self.elements[1:]):
+            self.assertEqual(self.t.successor(x), y)
+            self.assertEqual(self.t.predecessor(y), x)
+
+    def test_discard(self):
+        for x in self.elements[::2]:
+            self.t.discard(x)
+        self.assertEqual(list(self.t), self.elements[1::2])
+        self.assertLessEqual(
+            len(self.t._root.clusters), len(self.elements[1::2]),
+        )
+
+    def test_snapshot(self):
+        snapshot = self.t.snapshot()
+        for x in self.elements[::2]:
+            self.t.discard(x)
+        snapshot.add(3)
+        self.assertEqual(list(self.t), self.elements[1::2])
+        self.assertEqual(list(snapshot), sorted([3, *self.elements]))
+
+    def test_clusters_are_shared_only_once_snapshotted(self):
+        self.assertIs(self.t._root.clusters.__class__, _core._SparseClusters)
+        snapshot = self.t.snapshot()
+        snapshot.add(3)
+        self.t.add(5)
+        self.assertIs(self.t._root.clusters.__class__, _core._SharedClusters)
+        self.assertEqual(list(self.t), sorted([5, *self.elements]))
+        self.assertEqual(list(snapshot), sorted([3, *self.elements]))
+
+
+class TestFrozenVEBTree(TestCase):
+    def test_from_tree(self):
+        t = vEBTree([3, 1, 4, 159, 26])
+        frozen = frozenvEBTree(t)
+        self.assertEqual(list(frozen), [1, 3, 4, 26, 159])
+        self.assertEqual(len(frozen), 5)
+
+    def test_from_iterable(self):
+        frozen = frozenvEBTree(x for x in [5, 3, 5, 1])
+        self.assertEqual(list(frozen), [1, 3, 5])
+
+    def test_contains(self):
+        frozen = frozenvEBTree([2, 4, 8])
+        self.assertIn(4, frozen)
+        self.assertNotIn(5, frozen)
+        self.assertNotIn(100, frozen)
+        self.assertNotIn(-1, frozen)
+
+    def test_min_max(self):
+        frozen = frozenvEBTree([7, 2, 9])
+        self.assertEqual((frozen.min, frozen.max), (2, 9))
+
+    def test_empty(self):
+        frozen = frozenvEBTree()
+        self.assertIsNone(frozen.min)
+        self.assertIsNone(frozen.max)
+        self.assertIsNone(frozen.successor(0))
+        self.assertIsNone(frozen.predecessor(0))
+        self.assertEqual(list(frozen), [])
+        self.assertFalse(frozen)
+
+    def test_successor_predecessor(self):
+        t = vEBTree(random.sample(range(1 << 12), 300))
+        frozen = frozenvEBTree(t)
+        for x in range(-1, (1 << 12) + 1, 7):
+            self.assertEqual(frozen.successor(x), t.successor(x))
+            self.assertEqual(frozen.predecessor(x), t.predecessor(x))
+
+    def test_reversed(self):
+        self.assertEqual(list(reversed(frozenvEBTree([1, 2, 3]))), [3, 2, 1])
+
+    def test_hashable(self):
+        self.assertEqual(hash(frozenvEBTree([1, 2])), hash(frozenset([1, 2])))
+        elements = random.sample(range(1 << 40), 100)
+        self.assertEqual(
+            hash(frozenvEBTree(elements)), hash(frozenset(elements)),
+        )
+        self.assertEqual(
+            {frozenset(elements): 1}[frozenvEBTree(elements)], 1,
+        )
+        self.assertEqual(
+            {frozenvEBTree([1, 2]), frozenvEBTree([2, 1])},
+            {frozenvEBTree([1, 2])},
+        )
+
+    def test_equality(self):
+        self.assertEqual(frozenvEBTree([1, 2]), frozenvEBTree([2, 1]))
+        self.assertNotEqual(frozenvEBTree([1, 2]), frozenvEBTree([1]))
+        self.assertEqual(frozenvEBTree([1, 2]), frozenset([1, 2]))
+        self.assertEqual(frozenvEBTree([1, 2]), vEBTree([1, 2]))
+
+    def test_huge_elements(self):
+        frozen = frozenvEBTree([1 << 70, 3])
+        self.assertIn(1 << 70, frozen)
+        self.assertEqual(frozen.successor(3), 1 << 70)
+
+    def test_repr(self):
+        self.assertEqual(repr(frozenvEBTree([2, 1])), "frozenvEBTree([1, 2])")
+
+
+class TestConcurrentVEBTree(TestCase, VEBTestMixin):
+    def setUp(self):
+        self.t = ConcurrentvEBTree()
+        self.t.grow(4)
+
+    def test_repr(self):
+        self.t.update([1, 3])
+        self.assertEqual(repr(self.t), "ConcurrentvEBTree([1, 3])")
+
+    def test_queries(self):
+        t = ConcurrentvEBTree([1, 5, 300], word_size=2)
+        self.assertEqual(
+            (t.min, t.max, t.successor(5), t.predecessor(5), t.rank(300)),
+            (1, 300, 300, 1, 2),
+        )
+        self.assertEqual(list(t.irange(2, 400)), [5, 300])
+        self.assertEqual(t, vEBTree([1, 5, 300]))
+        self.assertEqual(t, ConcurrentvEBTree([1, 5, 300]))
+
+    def test_readers_keep_the_snapshot_they_started_with(self):
+        t = ConcurrentvEBTree(range(10))
+        iterator = iter(t)
+        next(iterator)
+        t.discard_range(0, 9)
+        t.add(1 << 20)
+        self.assertEqual(list(iterator), list(range(1, 10)))
+        self.assertEqual(list(t), [1 << 20])
+
+    def test_cursor_walks_a_snapshot(self):
+        t = ConcurrentvEBTree([1, 5, 7])
+        cursor = t.cursor(2)
+        t.discard(7)
+        self.assertEqual((cursor.peek(), cursor.next()), (5, 7))
+
+    def test_snapshot(self):
+        t = ConcurrentvEBTree([1, 5])
+        snapshot = t.snapshot()
+        snapshot.add(3)
+        t.add(7)
+        self.assertEqual(list(t), [1, 5, 7])
+        self.assertEqual(list(snapshot), [1, 3, 5])
+
+    def test_readers_leave_the_published_tree_untouched(self):
+        t = ConcurrentvEBTree(range(0, 1 << 10, 3))
+        published = t._published
+        state = dict(vars(published))
+        t.snapshot().add(1)
+        t.cursor(5).next()
+        self.assertIs(t._published, published)
+        self.assertEqual(vars(published), state)
+
+    def test_copy(self):
+        t = ConcurrentvEBTree([1, 5])
+        copied = copy.copy(t)
+        copied.add(3)
+        self.assertIsInstance(copied, ConcurrentvEBTree)
+        self.assertEqual(list(t), [1, 5])
+        self.assertEqual(list(copied), [1, 3, 5])
+
+    def test_queue(self):
+        t = ConcurrentvEBTree([5, 7])
+        t.push(1)
+        t.push(9)
+        self.assertEqual((t.peek_min(), t.peek_max()), (1, 9))
+        self.assertEqual((t.pop_min(), t.pop_max()), (1, 9))
+        self.assertEqual(t.popn_min(5), [5, 7])
+
+    def test_pop_remove_and_clear(self):
+        t = ConcurrentvEBTree([1, 5, 7])
+        self.assertEqual(t.pop(), 1)
+        t.remove(5)
+        with self.assertRaises(KeyError):
+            t.remove(5)
+        t.clear()
+        self.assertFalse(t)
+        with self.assertRaises(KeyError):
+            t.pop()
+
+    def test_in_place_set_operations(self):
+        t = ConcurrentvEBTree([1, 5, 7])
+        t |= ConcurrentvEBTree([2])
+        t -= {5}
+        t &= vEBTree([1, 2, 5, 7, 9])
+        t ^= [1, 3]
+        self.assertEqual(list(t), [2, 3, 7])
+
+    def test_pickle(self):
+        t = ConcurrentvEBTree([1, 5, 300], word_size=4)
+        loaded = pickle.loads(pickle.dumps(t))  # noqa: S301
+        self.assertEqual(loaded, t)
+        self.assertEqual(loaded.word_size, 4)
+
+    def test_concurrent_reads_see_consistent_trees(self):
+        t = ConcurrentvEBTree([0], word_size=2)
+        problems = []
+
+        def write():
+            for i in range(1, 2000):
+                t.add(i * i)  # growing the universe now and then
+                if i % 3 == 0:
+                    t.discard((i - 1) * (i - 1))
+
+        def read():
+            while writer.is_alive():
+                snapshot = t.snapshot()
+                elements = list(snapshot)
+                if (
+                    len(elements) != len(snapshot)
+                    or elements[0] != snapshot.min
+                    or elements[-1] != snapshot.max
+                    or elements[-1] >= snapshot.universe_size
+                ):
+                    problems.append(elements)
+                t.successor(t.max or 0)
+
+        writer = threading.Thread(target=write)
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        writer.start()
+        for each in readers:
+            each.start()
+        for each in [writer, *readers]:
+            each.join()
+        self.assertEqual(problems, [])
+        self.assertEqual(len(t), 2000 - 666)
+
+
+class TestVEBDict(TestCase):
+    def setUp(self):
+        self.d = vEBDict({300: "c", 1: "a", 5: "b", 4096: "d"}, word_size=2)
+
+    def test_mapping(self):
+        self.assertEqual(self.d[5], "b")
+        self.assertEqual(len(self.d), 4)
+        self.assertIn(300, self.d)
+        self.assertNotIn(301, self.d)
+        with self.assertRaises(KeyError):
+            self.d[2]
+
+    def test_ordered(self):
+        self.assertEqual(list(self.d), [1, 5, 300, 4096])
+        self.assertEqual(list(reversed(self.d)), [4096, 300, 5, 1])
+        self.assertEqual(
+            list(self.d.items()),
+            [(1, "a"), (5, "b"), (300, "c"), (4096, "d")],
+        )
+        self.assertEqual(list(self.d.values()), ["a", "b", "c", "d"])
+
+    def test_set_and_delete(self):
+        self.d[5] = "B"
+        self.d[7] = "e"
+        del self.d[300]
+        with self.assertRaises(KeyError):
+            del self.d[300]
+        self.assertEqual(
+            list(self.d.items()),
+            [(1, "a"), (5, "B"), (7, "e"), (4096, "d")],
+        )
+
+    def test_negative_keys(self):
+        self.d[-1 << 40] = "x"
+        self.d[-3] = "y"
+        self.assertEqual(list(self.d)[:3], [-1 << 40, -3, 1])
+        self.assertEqual(self.d.successor_item(-1 << 40), (-3, "y"))
+        self.assertEqual(list(self.d[:0]), [-1 << 40, -3])
+
+    def test_successor_predecessor_item(self):
+        self.assertEqual(self.d.successor_item(5), (300, "c"))
+        self.assertEqual(self.d.successor_item(0), (1, "a"))
+        self.assertIsNone(self.d.successor_item(4096))
+        self.assertEqual(self.d.predecessor_item(300), (5, "b"))
+        self.assertIsNone(self.d.predecessor_item(1))
+
+    def test_floor_and_ceiling_key(self):
+        self.assertEqual(self.d.floor_key(5), 5)
+        self.assertEqual(self.d.floor_key(299), 5)
+        self.assertIsNone(self.d.floor_key(0))
+        self.assertEqual(self.d.floor_key(1 << 20), 4096)
+        self.assertEqual(self.d.ceiling_key(5), 5)
+        self.assertEqual(self.d.ceiling_key(6), 300)
+        self.assertIsNone(self.d.ceiling_key(4097))
+
+    def test_slicing(self):
+        self.assertEqual(self.d[5:4096], vEBDict({5: "b", 300: "c"}))
+        self.assertEqual(list(self.d[:300]), [1, 5])
+        self.assertEqual(list(self.d[300:]), [300, 4096])
+        self.assertEqual(list(self.d[5000:]), [])
+        self.assertEqual(self.d[:].word_size, 2)
+        with self.assertRaises(ValueError):
+            self.d[::2]
+
+    def test_slices_are_independent(self):
+        sliced = self.d[:]
+        sliced[2] = "x"
+        self.assertNotIn(2, self.d)
+
+    def test_pop_and_clear(self):
+        self.assertEqual(self.d.pop(5), "b")
+        self.assertEqual(self.d.popitem(), (1, "a"))
+        self.d.clear()
+        self.assertEqual(len(self.d), 0)
+        self.assertEqual(list(self.d), [])
+
+    def test_repr(self):
+        self.assertEqual(repr(vEBDict({2: 1, 1: 2})), "vEBDict({1: 2, 2: 1})")
+
+    def test_reversed_items_and_values(self):
+        self.assertEqual(
+            list(reversed(self.d.items())),
+            [(4096, "d"), (300, "c"), (5, "b"), (1, "a")],
+        )
+        self.assertEqual(list(reversed(self.d.values())), ["d", "c", "b", "a"])
+
+    def test_growing_lifts_the_minimum_out_of_the_old_root(self):
+        d = vEBDict({3: "a", 2: "b", 1: "c"}, word_size=4)
+        old_root = d._root
+        d[10] = "d"
+        self.assertIs(d._root.clusters[0], old_root)
+        self.assertEqual((d._root.min, d._root.min_value), (1, "c"))
+        self.assertEqual(list(old_root.items()), [(2, "b"), (3, "a")])
+        self.assertEqual(
+            list(d.items()), [(1, "c"), (2, "b"), (3, "a"), (10, "d")],
+        )
+
+    def test_moving_the_base_down(self):
+        d = vEBDict({3: "a", 5: "b"}, word_size=4)
+        d[-2] = "c"
+        d[-1 << 20] = "e"
+        self.assertEqual(
+            list(d.items()), [(-1 << 20, "e"), (-2, "c"), (3, "a"), (5, "b")],
+        )
+        self.assertEqual(d.predecessor_item(3), (-2, "c"))
+        self.assertEqual(d.successor_item(-2), (3, "a"))
+
+    def test_slice_beyond_the_keys(self):
+        d = vEBDict({5: "a"})
+        self.assertEqual(d[10 ** 12:10 ** 12 + 3], vEBDict())
+        self.assertEqual(d[-10 ** 12:-10 ** 12 + 3], vEBDict())
+
+    def test_non_integer_keys(self):
+        self.assertNotIn("x", self.d)
+        self.assertIsNone(self.d.get("x"))
+        with self.assertRaises(KeyError):
+            self.d["x"]
+
+
+class TestVEBMultiset(TestCase):
+    def setUp(self):
+        self.m = vEBMultiset([5, 1, 5, 300, 5, 1], word_size=2)
+
+    def test_count(self):
+        self.assertEqual(
+            [self.m.count(x) for x in (1, 5, 300, 7)], [2, 3, 1, 0],
+        )
+
+    def test_len_counts_repeats(self):
+        self.assertEqual(len(self.m), 6)
+        self.m.add(7, n=4)
+        self.assertEqual(len(self.m), 10)
+        self.m.remove_one(5)
+        self.assertEqual(len(self.m), 9)
+
+    def test_iter(self):
+        self.assertEqual(list(self.m), [1, 1, 5, 5, 5, 300])
+        self.assertEqual(list(reversed(self.m)), [300, 5, 5, 5, 1, 1])
+        self.assertEqual(list(self.m.items()), [(1, 2), (5, 3), (300, 1)])
+
+    def test_add(self):
+        self.assertEqual(self.m.add(5), 4)
+        self.assertEqual(self.m.add(9, n=2), 2)
+        self.assertEqual(self.m.count(9), 2)
+        with self.assertRaises(ValueError):
+            self.m.add(9, n=0)
+        self.assertEqual(self.m.add(-1), 1)
+        self.assertEqual(self.m.min, -1)
+        self.assertEqual(len(self.m), 10)
+
+    def test_remove_one(self):
+        self.assertEqual(self.m.remove_one(1), 1)
+        self.assertEqual(self.m.remove_one(1), 0)
+        self.assertNotIn(1, self.m)
+        with self.assertRaises(KeyError):
+            self.m.remove_one(1)
+        self.assertEqual(self.m.min, 5)
+        self.assertEqual(len(self.m), 4)
+
+    def test_successor_predecessor_skip_repeats(self):
+        self.assertEqual(self.m.successor(1), 5)
+        self.assertEqual(self.m.successor(5), 300)
+        self.assertIsNone(self.m.successor(300))
+        self.assertEqual(self.m.predecessor(300), 5)
+        self.assertIsNone(self.m.predecessor(1))
+
+    def test_min_max(self):
+        self.assertEqual((self.m.min, self.m.max), (1, 300))
+        self.assertEqual((vEBMultiset().min, vEBMultiset().max), (None, None))
+
+    def test_equality(self):
+        self.assertEqual(self.m, vEBMultiset([1, 1, 5, 5, 5, 300]))
+        self.assertNotEqual(self.m, vEBMultiset([1, 5, 300]))
+
+    def test_repr(self):
+        self.assertEqual(
+            repr(vEBMultiset([2, 1, 2])), "vEBMultiset([1, 2, 2])",
+        )
+
+    def test_counts_are_kept_in_the_nodes(self):
+        counts = self.m._counts
+        self.assertEqual(
+            [(counts._base + x, n) for x, n in counts._root.items()],
+            [(1, 2), (5, 3), (300, 1)],
+        )
+
+    def test_negative_elements(self):
+        m = vEBMultiset([-3, 5, -3, -1 << 40], word_size=2)
+        self.assertEqual(list(m), [-1 << 40, -3, -3, 5])
+        self.assertEqual(list(reversed(m)), [5, -3, -3, -1 << 40])
+        self.assertEqual(m.predecessor(5), -3)
+        self.assertEqual(m.remove_one(-3), 1)
+        self.assertEqual(m.count(-3), 1)
+
+
+@skipIf(np is None, "NumPy is not installed")
+class TestNumPy(TestCase):
+    def test_from_array(self):
+        t = vEBTree.from_array(np.array([9, 3, 3, 700]))
+        self.assertEqual(list(t), [3, 9, 700])
+        self.assertEqual(len(t), 3)
+
+    def test_from_array_empty(self):
+        self.assertEqual(list(vEBTree.from_array(np.array([]))), [])
+
+    def test_from_array_negative(self):
+        with self.assertRaises(ValueError):
+            vEBTree.from_array(np.array([-1, 2]))
+
+    def test_to_array(self):
+        array = vEBTree([5, 2, 1000]).to_array()
+        self.assertEqual(array.dtype, np.int64)
+        self.assertEqual(array.tolist(), [2, 5, 1000])
+
+    def test_to_array_negative(self):
+        array = vEBTree([-5, 3], auto_rebase=True).to_array()
+        self.assertEqual(array.dtype, np.int64)
+        self.assertEqual(array.tolist(), [-5, 3])
+
+    def test_to_array_beyond_int64(self):
+        array = vEBTree([3, (1 << 63) + 5]).to_array()
+        self.assertEqual(array.dtype, np.uint64)
+        self.assertEqual(array.tolist(), [3, (1 << 63) + 5])
+
+        elements = [-1, 1 << 64]
+        t = vEBTree(elements, auto_rebase=True)
+        self.assertEqual(t.to_array().tolist(), elements)
+
+    def test_many_beyond_int64(self):
+        t = vEBTree([3, (1 << 63) + 5])
+        queries = np.array([0, 4], dtype=np.uint64)
+        self.assertEqual(
+            t.successor_many(queries).tolist(), [3, (1 << 63) + 5],
+        )
+        self.assertEqual(
+            t.predecessor_many(queries, default=0).tolist(), [0, 3],
+        )
+
+    def test_contains_many(self):
+        t = vEBTree([1, 5, 64, 300], word_size=4)
+        found = t.contains_many(np.array([[5, 6], [300, -1], [1, 999]]))
+        self.assertEqual(
+            found.tolist(), [[True, False], [True, False], [True, False]],
+        )
+
+    def test_successor_many(self):
+        elements = sorted(random.sample(range(1 << 12), 200))
+        t = vEBTree(elements, word_size=4)
+        queries = np.random.randint(-5, (1 << 12) + 5, size=500)
+        self.assertEqual(
+            t.successor_many(queries).tolist(),
+            [
+                next((y for y in elements if y > x), -1)
+                for x in queries.tolist()
+            ],
+        )
+
+    def test_predecessor_many(self):
+        elements = sorted(random.sample(range(1 << 12), 200))
+        t = vEBTree(elements, word_size=4)
+        queries = np.random.randint(-5, (1 << 12) + 5, size=500)
+        self.assertEqual(
+            t.predecessor_many(queries).tolist(),
+            [
+                next((y for y in reversed(elements) if y < x), -1)
+                for x in queries.tolist()
+            ],
+        )
+
+    def test_many_keeps_the_shape_of_the_queries(self):
+        t = vEBTree([1, 5, 64, 300], word_size=4)
+        queries = np.array([[0, 5], [299, 301]])
+        self.assertEqual(
+            t.successor_many(queries).tolist(), [[1, 64], [300, -1]],
+        )
+        self.assertEqual(
+            t.predecessor_many(queries).tolist(), [[-1, 1], [64, 300]],
+        )
+
+    def test_many_on_empty_tree(self):
+        t = vEBTree()
+        queries = np.array([0, 3])
+        self.assertEqual(t.contains_many(queries).tolist(), [False, False])
+        self.assertEqual(t.successor_many(queries).tolist(), [-1, -1])
+        self.assertEqual(
+            t.predecessor_many(queries, default=-7).tolist(), [-7, -7],
+        )
+
+
 class VEBQueueTest:
     @expectedFailure
     def testCreateNotEvenPowerOfTwo(self):
@@ -390,12 +2033,14 @@ class LameQueue:
 
 
 class RandomTest(TestCase):
+    word_size = WORD_SIZE
+
     def testRandom(self):
         n = 1 << 16
         totalOperations = 1 << 16
         operations = totalOperations
 
-        q = vEBTree.of_size(n)
+        q = vEBTree.of_size(n, word_size=self.word_size)
         lame = LameQueue()
         while operations > 0:
             # Do some searches
@@ -427,3 +2072,8 @@ class RandomTest(TestCase):
             # Check the max/min variables
             self.assertEqual(lame.max(), q.max)
             self.assertEqual(lame.min(), q.min)
+            self.assertEqual(len(lame.q), len(q))
+
+
+class SmallWordRandomTest(RandomTest):
+    word_size = 2